@@ -3,22 +3,38 @@ const User = require('../models/User');
 const jwt = require('jsonwebtoken');
 const fs = require('fs');
 
+// Store a chatbot upload and respond with its id
+const storeChatbotFile = async (res, fields) => {
+  // Ensure user exists
+  const user = await User.findById(fields.userId);
+  if (!user) {
+    return res.status(404).json({ error: 'User not found' });
+  }
+  
+  const filename = `${Date.now()}-${fields.originalName}`;
+  
+  const newFile = new FileUpload({
+    ...fields,
+    filename,
+    uploadSource: 'chatbot'
+  });
+  
+  await newFile.save();
+  
+  res.status(201).json({ 
+    message: 'File saved successfully',
+    fileId: newFile._id,
+    filename: newFile.filename 
+  });
+};
+
 // Save file to database
 exports.saveFile = async (req, res) => {
   try {
     const { userId, originalName, mimeType, fileData, documentType, classification, extractedData, size, whatsappNumber } = req.body;
     
-    // Ensure user exists
-    const user = await User.findById(userId);
-    if (!user) {
-      return res.status(404).json({ error: 'User not found' });
-    }
-    
-    const filename = `${Date.now()}-${originalName}`;
-    
-    const newFile = new FileUpload({
+    await storeChatbotFile(res, {
       userId,
-      filename,
       originalName,
       mimeType,
       fileData: Buffer.from(fileData, 'base64'),
@@ -26,16 +42,32 @@ exports.saveFile = async (req, res) => {
       classification,
       extractedData,
       size,
-      uploadSource: 'chatbot',
       whatsappNumber
     });
+  } catch (error) {
+    res.status(400).json({ error: error.message });
+  }
+};
+
+// Save a file sent as multipart/form-data, with the metadata as form fields
+exports.uploadFile = async (req, res) => {
+  try {
+    if (!req.file) {
+      return res.status(400).json({ error: 'No file uploaded' });
+    }
     
-    await newFile.save();
+    const { userId, originalName, mimeType, documentType, classification, extractedData, whatsappNumber } = req.body;
     
-    res.status(201).json({ 
-      message: 'File saved successfully',
-      fileId: newFile._id,
-      filename: newFile.filename 
+    await storeChatbotFile(res, {
+      userId,
+      originalName: originalName || req.file.originalname,
+      mimeType: mimeType || req.file.mimetype,
+      fileData: req.file.buffer,
+      documentType,
+      classification,
+      extractedData: extractedData ? JSON.parse(extractedData) : {},
+      size: req.file.size,
+      whatsappNumber
     });
   } catch (error) {
     res.status(400).json({ error: error.message });
@@ -2,45 +2,72 @@ import sys
 import re
 import json
 
+# Labels that introduce an EPF field. The text is scanned once for these,
+# and the matching field pattern is only tried where a label starts. The
+# scan runs case-sensitively over a lowercased copy of the text, which is
+# much faster than a case-insensitive scan.
+EPF_LABEL_PATTERN = re.compile(r"trr|establishment|wage|members|subscribers|grand|total")
+EPF_LABEL_PATTERN_ANY_CASE = re.compile(EPF_LABEL_PATTERN.pattern, re.IGNORECASE)
+
+# Field patterns keyed by the label they start with
+EPF_FIELD_PATTERNS = {
+    "trr": [("trrn_no", re.compile(r"trr\s*no\s*:\s*(\d+)", re.IGNORECASE))],
+    "establishment": [
+        ("establishment_id", re.compile(r"establishment\s*id\s*:\s*([a-z0-9]+)", re.IGNORECASE)),
+        ("establishment_name", re.compile(r"establishment\s*name\s*:\s*([a-z\s]+)", re.IGNORECASE))
+    ],
+    "wage": [("wage_month", re.compile(r"wage\s*month\s*:\s*([a-z0-9\s]+)", re.IGNORECASE))],
+    "members": [("member", re.compile(r"members\s*:\s*(\d+)", re.IGNORECASE))],
+    "subscribers": [("member", re.compile(r"subscribers\s*:\s*(\d+)", re.IGNORECASE))],
+    "grand": [("total_amount", re.compile(r"grand\s*total\s*:\s*(\d+)", re.IGNORECASE))],
+    "total": [("total_amount", re.compile(r"total\s*amount\s*:\s*(\d+)", re.IGNORECASE))]
+}
+EPF_FIELD_COUNT = 6
+
 def extract_epf_info(text):
     """Extract EPF-specific information from the OCR text."""
     try:
-        # Extract TRRN Number (number after "TRRN")
-        trrn_no = re.search(r"trr\s*no\s*:\s*(\d+)", text, re.IGNORECASE)
-        trrn_no = trrn_no.group(1) if trrn_no else None
-
-        # Extract Establishment ID (string after "Establishment ID")
-        establishment_id = re.search(r"establishment\s*id\s*:\s*([a-z0-9]+)", text, re.IGNORECASE)
-        establishment_id = establishment_id.group(1) if establishment_id else None
-
-        # Extract Establishment Name (string after "Establishment Name")
-        establishment_name = re.search(r"establishment\s*name\s*:\s*([a-z\s]+)", text, re.IGNORECASE)
-        establishment_name = establishment_name.group(1).strip() if establishment_name else None
+        # Keep the first occurrence of each field, as a per-field search would
+        fields = {}
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            labels = EPF_LABEL_PATTERN.finditer(lowered)
+        else:
+            # Some characters change length when lowercased, so offsets in
+            # the lowercased copy would not line up with the original text
+            labels = EPF_LABEL_PATTERN_ANY_CASE.finditer(text)
 
-        # Extract Wage Month (text after "Wage Month")
-        wage_month = re.search(r"wage\s*month\s*:\s*([a-z0-9\s]+)", text, re.IGNORECASE)
-        wage_month = wage_month.group(1).strip() if wage_month else None
+        for label in labels:
+            for name, pattern in EPF_FIELD_PATTERNS[label.group(0).lower()]:
+                if name in fields:
+                    continue
+                match = pattern.match(text, label.start())
+                if match:
+                    fields[name] = match.group(1)
+            if len(fields) == EPF_FIELD_COUNT:
+                break
 
-        # Extract Members (number after "Members" or "Subscribers")
-        member = re.search(r"(members|subscribers)\s*:\s*(\d+)", text, re.IGNORECASE)
-        member = int(member.group(2)) if member else None
-
-        # Extract Total Amount (number after "Grand Total" or "Total Amount")
-        total_amount = re.search(r"(grand\s*total|total\s*amount)\s*:\s*(\d+)", text, re.IGNORECASE)
-        total_amount = int(total_amount.group(2)) if total_amount else None
+        establishment_name = fields.get("establishment_name")
+        wage_month = fields.get("wage_month")
+        member = fields.get("member")
+        total_amount = fields.get("total_amount")
 
         return {
-            "trrnNo": trrn_no,
-            "establishmentId": establishment_id,
-            "establishmentName": establishment_name,
-            "wageMonth": wage_month,
-            "member": member,
-            "totalAmount": total_amount,
+            "trrnNo": fields.get("trrn_no"),
+            "establishmentId": fields.get("establishment_id"),
+            "establishmentName": establishment_name.strip() if establishment_name else None,
+            "wageMonth": wage_month.strip() if wage_month else None,
+            "member": int(member) if member else None,
+            "totalAmount": int(total_amount) if total_amount else None,
             "text": text
         }
     except Exception as e:
         raise Exception(f"Error extracting EPF info: {str(e)}")
 
+def extract_epf_batch(texts):
+    """Extract EPF information from each OCR text in a batch."""
+    return [extract_epf_info(text) for text in texts]
+
 def main(extracted_text):
     """Main function to extract EPF info and print it."""
     try:
@@ -54,7 +81,47 @@ def main(extracted_text):
         print(json.dumps({"status": "error", "message": str(e)}), file=sys.stderr)
         sys.exit(1)
 
+def run_batch(stdin=sys.stdin, stdout=sys.stdout):
+    """
+    Extract EPF info for many documents read as JSON lines.
+
+    Each input line is either a JSON string of OCR text or an object such as
+    {"id": "challan-1", "text": "..."}. One JSON result is written per input
+    line, in order, carrying the document's id when one was given. A bad
+    line produces an error result and the batch carries on.
+    """
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        doc_id = None
+        try:
+            document = json.loads(line)
+            if isinstance(document, dict):
+                doc_id = document.get("id")
+                text = document.get("text")
+            else:
+                text = document
+
+            if not isinstance(text, str):
+                raise Exception("No extracted text provided.")
+
+            result = extract_epf_info(text)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+
+        if doc_id is not None:
+            result["id"] = doc_id
+        stdout.write(json.dumps(result) + "\n")
+
+    stdout.flush()
+
 if __name__ == "__main__":
+    if "--batch" in sys.argv[1:]:
+        run_batch()
+        sys.exit(0)
+
     # Get extracted text from command-line argument
     if len(sys.argv) < 2:
         print(json.dumps({"status": "error", "message": "No extracted text provided."}), file=sys.stderr)
@@ -1,10 +1,18 @@
 const express = require('express');
+const multer = require('multer');
 const router = express.Router();
 const fileController = require('../controllers/fileController');
 const auth = require('../middleware/auth');
 
+// Multipart uploads from the chatbot are kept in memory, since the file is stored in MongoDB
+const upload = multer({
+  storage: multer.memoryStorage(),
+  limits: { fileSize: 50 * 1024 * 1024 }
+});
+
 // Routes that require authentication
 router.post('/save', fileController.saveFile);
+router.post('/upload', upload.single('file'), fileController.uploadFile);
 router.get('/', auth, fileController.getFiles);
 router.get('/:id', auth, fileController.getFile);
 router.get('/download/:id', auth, fileController.downloadFile);
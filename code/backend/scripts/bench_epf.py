@@ -0,0 +1,112 @@
+"""
+Micro-benchmark for EPF field extraction.
+
+Times the compiled single-pass extractor in epf.py against the previous
+per-field re.search implementation on a corpus of sample challan texts,
+and checks that both return the same fields.
+
+Usage: python3 scripts/bench_epf.py [documents] [repeats]
+"""
+import os
+import sys
+import re
+import random
+import time
+
+# epf.py lives in the backend root, one level above this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from epf import extract_epf_info, extract_epf_batch
+
+CHALLAN_TEMPLATE = """--- Page 1 ---
+employees' provident fund organisation
+combined challan of a/c no. 01, 02, 10, 21 & 22
+trr no : {trrn}
+establishment id : {est_id}
+establishment name : {est_name}
+wage month : {month} {year}
+{member_label} : {members}
+account 1 : {a1}  account 2 : {a2}  account 10 : {a10}
+{total_label} : {total}
+{filler}
+"""
+
+NAMES = ["acme textiles", "sunrise foods", "blue river logistics", "kaveri steel", "northwind traders"]
+MONTHS = ["january", "february", "march", "april", "may", "june", "july"]
+FILLER = "payment confirmation bank reference generated on the portal for the above challan "
+
+def legacy_extract_epf_info(text):
+    """Previous implementation: one uncompiled re.search per field."""
+    trrn_no = re.search(r"trr\s*no\s*:\s*(\d+)", text, re.IGNORECASE)
+    establishment_id = re.search(r"establishment\s*id\s*:\s*([a-z0-9]+)", text, re.IGNORECASE)
+    establishment_name = re.search(r"establishment\s*name\s*:\s*([a-z\s]+)", text, re.IGNORECASE)
+    wage_month = re.search(r"wage\s*month\s*:\s*([a-z0-9\s]+)", text, re.IGNORECASE)
+    member = re.search(r"(members|subscribers)\s*:\s*(\d+)", text, re.IGNORECASE)
+    total_amount = re.search(r"(grand\s*total|total\s*amount)\s*:\s*(\d+)", text, re.IGNORECASE)
+    return {
+        "trrnNo": trrn_no.group(1) if trrn_no else None,
+        "establishmentId": establishment_id.group(1) if establishment_id else None,
+        "establishmentName": establishment_name.group(1).strip() if establishment_name else None,
+        "wageMonth": wage_month.group(1).strip() if wage_month else None,
+        "member": int(member.group(2)) if member else None,
+        "totalAmount": int(total_amount.group(2)) if total_amount else None,
+        "text": text
+    }
+
+def build_corpus(size, seed=42):
+    """Generate sample challan texts, some with missing fields."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        text = CHALLAN_TEMPLATE.format(
+            trrn=rng.randint(10 ** 12, 10 ** 13),
+            est_id=f"mhban{rng.randint(10000, 99999)}",
+            est_name=rng.choice(NAMES),
+            month=rng.choice(MONTHS),
+            year=rng.choice([2023, 2024, 2025]),
+            member_label=rng.choice(["members", "subscribers"]),
+            members=rng.randint(1, 500),
+            a1=rng.randint(1000, 90000),
+            a2=rng.randint(100, 900),
+            a10=rng.randint(1000, 20000),
+            total_label=rng.choice(["grand total", "total amount"]),
+            total=rng.randint(10000, 900000),
+            filler=FILLER * rng.randint(1, 40)
+        )
+        if rng.random() < 0.2:
+            text = text.replace("trr no", "reference")
+        corpus.append(text)
+    return corpus
+
+def time_per_document(extract, corpus, repeats):
+    """Return the best average extraction time per document in microseconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for text in corpus:
+            extract(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+def main(argv):
+    documents = int(argv[1]) if len(argv) > 1 else 2000
+    repeats = int(argv[2]) if len(argv) > 2 else 5
+    corpus = build_corpus(documents)
+
+    # Both implementations must agree before their timings mean anything
+    for text, result in zip(corpus, extract_epf_batch(corpus)):
+        if result != legacy_extract_epf_info(text):
+            print("Mismatch between legacy and compiled extraction:")
+            print(text)
+            sys.exit(1)
+
+    re.purge()
+    legacy = time_per_document(legacy_extract_epf_info, corpus, repeats)
+    compiled = time_per_document(extract_epf_info, corpus, repeats)
+
+    print(f"documents: {documents}, repeats: {repeats}")
+    print(f"legacy per-field search: {legacy:8.1f} us/doc")
+    print(f"compiled single pass:    {compiled:8.1f} us/doc")
+    print(f"speedup:                 {legacy / compiled:8.2f}x")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -3,45 +3,188 @@ import sys
 import json
 import pytesseract
 from PIL import Image
-from pdf2image import convert_from_path
-from collections import Counter
+from pdf2image import convert_from_path, pdfinfo_from_path
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 import re
-import subprocess
-
-# Get image path from command-line argument (if provided)
-image_path = sys.argv[1] if len(sys.argv) > 1 else None
+import hashlib
+import ocr_cache
 
 # Define the base directory where the script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOADS_DIR = os.path.join(SCRIPT_DIR, "..", "uploads")  # Uploads folder
 
+# epf.py lives in the backend root, one level above this script
+sys.path.insert(0, os.path.join(SCRIPT_DIR, ".."))
+from epf import extract_epf_info
+
 # Ensure uploads directory exists
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-def process_pdf(pdf_path):
-    """Process PDF file and extract text from all pages."""
-    try:
+# OCR settings
+OCR_DPI = 300
+OCR_CONFIG = '--psm 6 --oem 3'
+OCR_LANG = 'eng'
+
+# Number of processes used to OCR PDF pages concurrently (1 = serial)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+
+# Number of PDF pages rasterized at a time on the serial path; only this
+# many full-resolution page images are ever held in memory at once
+OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "4"))
+
+# Stop OCR on a PDF as soon as the classification is decided. A category is
+# decided once it has at least EARLY_EXIT_MIN_HITS keyword hits and leads
+# the runner-up by at least EARLY_EXIT_MARGIN hits.
+EARLY_EXIT = os.getenv("CLASSIFY_EARLY_EXIT", "0") == "1"
+EARLY_EXIT_MIN_HITS = int(os.getenv("CLASSIFY_EARLY_EXIT_MIN_HITS", "2"))
+EARLY_EXIT_MARGIN = int(os.getenv("CLASSIFY_EARLY_EXIT_MARGIN", "2"))
+
+# Keywords that identify each document category, with the weight each hit
+# adds to that category's score. CLASSIFY_KEYWORDS_FILE may point to a JSON
+# file of the form {"PF Filing": {"provident fund": 1, ...}, ...} instead.
+DEFAULT_KEYWORDS = {
+    "PF Filing": {"provident fund": 1},
+    "GST Filing": {"supply": 1},
+    "ITR Filing": {"form no. 16": 1},
+}
+CLASSIFY_KEYWORDS_FILE = os.getenv("CLASSIFY_KEYWORDS_FILE")
+
+# Process pool shared by every PDF handled in this interpreter
+_ocr_pool = None
+
+def get_ocr_pool(workers):
+    """Return the shared page OCR process pool, creating it on first use."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=workers)
+    return _ocr_pool
+
+def ocr_image(img):
+    """Run Tesseract on a PIL image and return lowercased text."""
+    img = img.convert('L')  # Convert to grayscale
+    return pytesseract.image_to_string(
+        img,
+        config=OCR_CONFIG,
+        lang=OCR_LANG
+    ).lower()
+
+def get_page_count(pdf_path):
+    """Return the number of pages in a PDF."""
+    page_count = pdfinfo_from_path(pdf_path)["Pages"]
+    if not page_count:
+        raise Exception("No images extracted from PDF")
+    return page_count
+
+def iter_pdf_pages(pdf_path, window=None, first_window=None):
+    """
+    Yield (page_num, image) pairs for a PDF, rasterizing a few pages at a time.
+
+    Each image is closed once the caller moves on to the next page, so peak
+    memory is bounded by the window size rather than the document length.
+    With first_window, the first batch is that small and batches double up
+    to window, so a caller that stops early doesn't rasterize pages it never
+    reads.
+    """
+    window = max(1, OCR_PAGE_WINDOW if window is None else window)
+    size = window if first_window is None else max(1, min(first_window, window))
+    page_count = get_page_count(pdf_path)
+
+    first_page = 1
+    while first_page <= page_count:
+        last_page = min(first_page + size - 1, page_count)
         images = convert_from_path(
             pdf_path,
-            dpi=300,
+            dpi=OCR_DPI,
             fmt='jpeg',
-            thread_count=4
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=min(4, last_page - first_page + 1)
         )
-        
-        if not images:
-            raise Exception("No images extracted from PDF")
-
-        extracted_text = ""
-        for page_num, img in enumerate(images, 1):
-            img = img.convert('L')  # Convert to grayscale
-            text = pytesseract.image_to_string(
-                img,
-                config='--psm 6 --oem 3',
-                lang='eng'
-            ).lower()
-            extracted_text += f"\n\n--- Page {page_num} ---\n{text}"
-            
-        return extracted_text.strip()
+
+        for offset in range(len(images)):
+            img, images[offset] = images[offset], None
+            try:
+                yield first_page + offset, img
+            finally:
+                img.close()
+
+        first_page = last_page + 1
+        size = min(size * 2, window)
+
+def ocr_pdf_page(pdf_path, page_num):
+    """Rasterize and OCR a single PDF page."""
+    images = convert_from_path(
+        pdf_path,
+        dpi=OCR_DPI,
+        fmt='jpeg',
+        first_page=page_num,
+        last_page=page_num
+    )
+    if not images:
+        return ""
+
+    try:
+        return ocr_image(images[0])
+    finally:
+        images[0].close()
+
+def format_pages(page_texts):
+    """Join per-page text using the "--- Page N ---" layout."""
+    extracted_text = ""
+    for page_num, text in enumerate(page_texts, 1):
+        extracted_text += f"\n\n--- Page {page_num} ---\n{text}"
+    return extracted_text.strip()
+
+def iter_page_texts(pdf_path, workers, may_stop=False):
+    """
+    Yield the OCR text of each PDF page in page order.
+
+    When the caller may_stop early, work starts one page at a time and only
+    ramps up to the full window or pool while pages leave the answer open.
+    """
+    if workers <= 1:
+        # Stream pages through OCR so only one window is in memory at a time
+        for _, img in iter_pdf_pages(pdf_path, first_window=1 if may_stop else None):
+            yield ocr_image(img)
+        return
+
+    # Each pool worker rasterizes and OCRs its own page, so only the page
+    # number crosses the process boundary. Pages are submitted a bounded
+    # distance ahead of the reader so an early stop leaves little work queued.
+    pool = get_ocr_pool(workers)
+    page_count = get_page_count(pdf_path)
+    pending = deque()
+    next_page = 1
+    ahead = 1 if may_stop else workers * 2
+    try:
+        while next_page <= page_count or pending:
+            while next_page <= page_count and len(pending) < ahead:
+                pending.append(pool.submit(ocr_pdf_page, pdf_path, next_page))
+                next_page += 1
+            yield pending.popleft().result()
+            ahead = min(ahead * 2, workers * 2)
+    finally:
+        for future in pending:
+            future.cancel()
+
+def process_pdf(pdf_path, workers=None, classifier=None):
+    """
+    Process PDF file and extract text from all pages.
+
+    When an IncrementalClassifier is given, each page's text is fed to it
+    as soon as it is read and OCR stops once the classifier has decided.
+    """
+    workers = OCR_WORKERS if workers is None else workers
+    try:
+        page_texts = []
+        may_stop = classifier is not None and classifier.can_decide
+        for text in iter_page_texts(pdf_path, workers, may_stop):
+            page_texts.append(text)
+            if classifier is not None and classifier.feed(text):
+                break
+
+        return format_pages(page_texts)
     except Exception as e:
         raise Exception(f"PDF processing error: {str(e)}")
 
@@ -49,28 +192,71 @@ def process_image(image_path):
     """Process single image file and extract text."""
     try:
         with Image.open(image_path) as img:
-            img = img.convert('L')  # Convert to grayscale
-            return pytesseract.image_to_string(
-                img,
-                config='--psm 6 --oem 3',
-                lang='eng'
-            ).lower()
+            return ocr_image(img)
     except Exception as e:
         raise Exception(f"Image processing error: {str(e)}")
 
+def load_keywords(keywords_file=None):
+    """Load the category keyword table, falling back to DEFAULT_KEYWORDS."""
+    if not keywords_file:
+        return DEFAULT_KEYWORDS
+    try:
+        with open(keywords_file) as f:
+            return json.load(f)
+    except Exception as e:
+        raise Exception(f"Error loading keywords from {keywords_file}: {str(e)}")
+
+def build_keyword_matcher(keywords):
+    """
+    Compile a keyword table into one alternation regex plus a lookup table.
+
+    Each keyword is its own capture group, and lookup[i] holds the
+    (category, weight) of group i + 1, so a match is scored by which group
+    matched rather than by its text (case-insensitive matches such as "ſ"
+    for "s" don't lowercase back to the keyword). Longer keywords are tried
+    first, so a phrase that contains a shorter keyword is counted once, as
+    the longer phrase.
+    """
+    scores = {}
+    for category, terms in keywords.items():
+        for keyword, weight in terms.items():
+            if not keyword.strip():
+                raise Exception(f"Empty keyword in category {category}")
+            scores[keyword.lower()] = (category, weight)
+
+    # An empty alternation would match at every word boundary
+    if not scores:
+        raise Exception("Keyword table has no keywords")
+
+    alternatives = sorted(scores, key=len, reverse=True)
+    pattern = re.compile(
+        r'\b(?:' + '|'.join(f'({re.escape(keyword)})' for keyword in alternatives) + r')\b',
+        flags=re.IGNORECASE
+    )
+    lookup = [scores[keyword] for keyword in alternatives]
+    return pattern, lookup
+
+CLASSIFY_KEYWORDS = load_keywords(CLASSIFY_KEYWORDS_FILE)
+KEYWORD_PATTERN, KEYWORD_LOOKUP = build_keyword_matcher(CLASSIFY_KEYWORDS)
+
+# Fingerprint of the keyword table, so cached classifications are not
+# reused after the table changes
+KEYWORDS_VERSION = hashlib.sha256(
+    json.dumps(CLASSIFY_KEYWORDS, sort_keys=True).encode('utf-8')
+).hexdigest()[:16]
+
+def count_keywords(text):
+    """Score every category's keyword hits in a single pass over the text."""
+    # Seed every category so ties still resolve in keyword table order
+    keyword_counts = Counter({category: 0 for category in CLASSIFY_KEYWORDS})
+    for match in KEYWORD_PATTERN.finditer(text):
+        category, weight = KEYWORD_LOOKUP[match.lastindex - 1]
+        keyword_counts[category] += weight
+    return keyword_counts
+
 def classify_document(text):
     """Classify the document based on keywords."""
-    keywords = {
-        "provident fund": "PF Filing",
-        "supply": "GST Filing",
-        "form no. 16": "ITR Filing",
-    }
-
-    keyword_counts = Counter()
-    for keyword, category in keywords.items():
-        pattern = rf'\b{re.escape(keyword)}\b'
-        matches = re.findall(pattern, text, flags=re.IGNORECASE)
-        keyword_counts[category] += len(matches)
+    keyword_counts = count_keywords(text)
 
     # If no keywords are found, classify as "Unknown Document Type"
     if not keyword_counts or sum(keyword_counts.values()) == 0:
@@ -79,6 +265,36 @@ def classify_document(text):
     # Otherwise, return the most common classification
     return keyword_counts.most_common(1)[0][0]
 
+class IncrementalClassifier:
+    """Accumulate keyword scores page by page and report when the type is decided."""
+
+    def __init__(self, min_hits=None, margin=None):
+        self.min_hits = EARLY_EXIT_MIN_HITS if min_hits is None else min_hits
+        self.margin = EARLY_EXIT_MARGIN if margin is None else margin
+        self.keyword_counts = Counter()
+        self.pages_read = 0
+
+    @property
+    def can_decide(self):
+        """False for a classifier that only counts pages and never stops OCR."""
+        return self.min_hits != float("inf")
+
+    def feed(self, page_text):
+        """Add one page of text and return True once the category is decided."""
+        self.keyword_counts.update(count_keywords(page_text))
+        self.pages_read += 1
+        return self.is_decided()
+
+    def is_decided(self):
+        """Check whether the leading category is far enough ahead to stop."""
+        top = self.keyword_counts.most_common(2)
+        if not top:
+            return False
+
+        leader_hits = top[0][1]
+        runner_up_hits = top[1][1] if len(top) > 1 else 0
+        return leader_hits >= self.min_hits and leader_hits - runner_up_hits >= self.margin
+
 def extract_dates(text):
     """Extract dates from the text."""
     date_patterns = [
@@ -93,48 +309,66 @@ def extract_dates(text):
 
     return dates[0] if dates else "No Date Found"
 
-def send_to_epf_script(extracted_text):
-    """Send extracted text to epf.py for further processing."""
-    try:
-        # Call epf.py as a subprocess and pass the extracted text
-        result = subprocess.run(
-            ["python3", "epf.py", extracted_text],
-            capture_output=True,
-            text=True
-        )
-        # Print the output from epf.py for debugging
-        print("Output from epf.py:", result.stdout, file=sys.stderr)
-        if result.returncode != 0:
-            print("Error in epf.py:", result.stderr, file=sys.stderr)
-    except Exception as e:
-        print(f"Error calling epf.py: {str(e)}", file=sys.stderr)
+def extract_epf_fields(text):
+    """Extract EPF challan fields without echoing the OCR text back."""
+    epf_data = extract_epf_info(text)
+    epf_data.pop("text", None)
+    return epf_data
 
-try:
-    # Determine file to process
-    if image_path and os.path.exists(image_path):
-        file_path = image_path
-    else:
-        files = sorted(
-            [f for f in os.listdir(UPLOADS_DIR) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.pdf'))],
-            key=lambda x: os.path.getmtime(os.path.join(UPLOADS_DIR, x)),
-            reverse=True
-        )
-        
-        if not files:
-            print(json.dumps({"error": "No valid files found in uploads directory"}))
-            sys.exit(1)
-            
-        file_path = os.path.join(UPLOADS_DIR, files[0])
+# Extractors run on the OCR text after classification, keyed by the
+# classification they apply to. Each result is added to the output under
+# the extractor's key.
+POST_EXTRACTORS = {
+    "PF Filing": [("epf", extract_epf_fields)],
+}
+
+def register_extractor(classification, key, extractor):
+    """Run extractor(text) for documents with this classification."""
+    POST_EXTRACTORS.setdefault(classification, []).append((key, extractor))
+
+def run_extractors(classification, text, result):
+    """Add the output of every extractor registered for the classification."""
+    for key, extractor in POST_EXTRACTORS.get(classification, []):
+        try:
+            result[key] = extractor(text)
+        except Exception as e:
+            print(f"Error in {key} extractor: {str(e)}", file=sys.stderr)
+    return result
+
+def ocr_settings(early_exit):
+    """Return the settings that affect OCR output, used in the cache key."""
+    settings = [OCR_DPI, OCR_CONFIG, OCR_LANG, KEYWORDS_VERSION]
+    if early_exit:
+        settings += ["early-exit", EARLY_EXIT_MIN_HITS, EARLY_EXIT_MARGIN]
+    return settings
+
+def classify_file(file_path, early_exit=None):
+    """Run the full OCR, classification and date pipeline on one file."""
+    early_exit = EARLY_EXIT if early_exit is None else early_exit
+
+    # Re-uploads of the same file with the same settings skip OCR entirely
+    cache_key = ocr_cache.make_key(file_path, ocr_settings(early_exit))
+    cached = ocr_cache.lookup(cache_key)
+    if cached:
+        return run_extractors(cached["classification"], cached["text"], {
+            "classification": cached["classification"],
+            "date": cached["date"],
+            "pagesRead": cached["pagesRead"],
+            "cached": True
+        })
 
     # Extract text based on file type
     if file_path.lower().endswith('.pdf'):
-        extracted_text = process_pdf(file_path)
+        # Without early exit the classifier never decides, so it only counts pages
+        classifier = IncrementalClassifier() if early_exit else IncrementalClassifier(min_hits=float("inf"))
+        extracted_text = process_pdf(file_path, classifier=classifier)
+        pages_read = classifier.pages_read
     else:
         extracted_text = process_image(file_path)
+        pages_read = 1
 
     if not extracted_text.strip():
-        print(json.dumps({"error": "No text extracted from the file"}))
-        sys.exit(1)
+        return {"error": "No text extracted from the file"}
 
     # Classify the document
     classification = classify_document(extracted_text)
@@ -142,16 +376,86 @@ try:
     # Extract dates from the text
     detected_date = extract_dates(extracted_text)
 
-    # Print result in JSON format
-    print(json.dumps({
+    ocr_cache.store(cache_key, extracted_text, classification, detected_date, pages_read)
+
+    # Field extraction for the detected document type, e.g. EPF challans
+    return run_extractors(classification, extracted_text, {
         "classification": classification,
-        "date": detected_date
-    }))
+        "date": detected_date,
+        "pagesRead": pages_read
+    })
+
+def latest_upload():
+    """Return the most recently uploaded supported file, if any."""
+    files = sorted(
+        [f for f in os.listdir(UPLOADS_DIR) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.pdf'))],
+        key=lambda x: os.path.getmtime(os.path.join(UPLOADS_DIR, x)),
+        reverse=True
+    )
+    return os.path.join(UPLOADS_DIR, files[0]) if files else None
+
+def run_worker(stdin=sys.stdin, stdout=sys.stdout):
+    """
+    Serve classification jobs over a JSON-lines protocol.
+
+    Each input line is a job such as {"id": 1, "path": "/tmp/upload.pdf"},
+    optionally with "earlyExit" to override CLASSIFY_EARLY_EXIT. Each output
+    line echoes the job id together with either the classification result or
+    an "error" message. The OCR libraries are imported once, so jobs only pay
+    for the OCR itself.
+    """
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            file_path = job.get("path")
+
+            if not file_path or not os.path.exists(file_path):
+                result = {"error": f"File not found: {file_path}"}
+            else:
+                result = classify_file(file_path, early_exit=job.get("earlyExit"))
+        except Exception as e:
+            result = {"error": str(e)}
+
+        result["id"] = job_id
+        stdout.write(json.dumps(result) + "\n")
+        stdout.flush()
+
+def main(argv):
+    """Classify a single file given on the command line."""
+    # Get image path from command-line argument (if provided)
+    image_path = argv[1] if len(argv) > 1 else None
 
-    # # If the document is classified as PF Filing, send the text to epf.py
-    # if classification == "PF Filing":
-    #     send_to_epf_script(extracted_text)
+    try:
+        # Determine file to process
+        if image_path and os.path.exists(image_path):
+            file_path = image_path
+        else:
+            file_path = latest_upload()
+
+            if not file_path:
+                print(json.dumps({"error": "No valid files found in uploads directory"}))
+                sys.exit(1)
+
+        result = classify_file(file_path)
+        if "error" in result:
+            print(json.dumps(result))
+            sys.exit(1)
+
+        # Print result in JSON format
+        print(json.dumps(result))
 
-except Exception as e:
-    print(json.dumps({"error": str(e)}), file=sys.stderr)
-    sys.exit(1)
\ No newline at end of file
+    except Exception as e:
+        print(json.dumps({"error": str(e)}), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv[1:]:
+        run_worker()
+    else:
+        main(sys.argv)
@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+
+# Define the base directory where the script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cache location, size limit (total bytes of cached text) and how long, in
+# seconds, the OCR text of a document is kept after it was stored
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE", "1") == "1"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(SCRIPT_DIR, "..", "temp", "ocr_cache.sqlite3"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+# Connection shared by every lookup in this interpreter
+_connection = None
+
+def get_connection():
+    """Return the cache database connection, creating the schema on first use."""
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(OCR_CACHE_PATH), exist_ok=True)
+        _connection = sqlite3.connect(OCR_CACHE_PATH, timeout=10)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                classification TEXT NOT NULL,
+                date TEXT NOT NULL,
+                pages_read INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                created REAL NOT NULL DEFAULT 0
+            )
+        """)
+        # Caches created before entries expired have no created column; their
+        # rows count as expired and are purged on first use
+        columns = [row[1] for row in _connection.execute("PRAGMA table_info(ocr_cache)")]
+        if "created" not in columns:
+            _connection.execute("ALTER TABLE ocr_cache ADD COLUMN created REAL NOT NULL DEFAULT 0")
+        _connection.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_access ON ocr_cache (last_access)")
+        _connection.execute("CREATE INDEX IF NOT EXISTS ocr_cache_created ON ocr_cache (created)")
+        _connection.commit()
+    return _connection
+
+def file_digest(file_path):
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_key(file_path, settings):
+    """Build a cache key from the file contents and the OCR settings used."""
+    return file_digest(file_path) + ":" + ":".join(str(value) for value in settings)
+
+def lookup(key):
+    """Return the cached result for a key, or None on a miss."""
+    if not OCR_CACHE_ENABLED:
+        return None
+    try:
+        conn = get_connection()
+        purge_expired(conn)
+        row = conn.execute(
+            "SELECT text, classification, date, pages_read FROM ocr_cache WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+
+        conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        return {
+            "text": row[0],
+            "classification": row[1],
+            "date": row[2],
+            "pagesRead": row[3]
+        }
+    except Exception as e:
+        print(f"OCR cache lookup error: {str(e)}", file=sys.stderr)
+        return None
+
+def store(key, text, classification, date, pages_read):
+    """Store a result and evict least recently used entries over the size limit."""
+    if not OCR_CACHE_ENABLED:
+        return
+    try:
+        conn = get_connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache (key, text, classification, date, pages_read, size, last_access, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, text, classification, date, pages_read, len(text.encode('utf-8')), now, now)
+        )
+        purge_expired(conn)
+        evict(conn)
+        conn.commit()
+    except Exception as e:
+        print(f"OCR cache store error: {str(e)}", file=sys.stderr)
+
+def purge_expired(conn):
+    """Delete entries stored more than OCR_CACHE_TTL seconds ago."""
+    conn.execute("DELETE FROM ocr_cache WHERE created <= ?", (time.time() - OCR_CACHE_TTL,))
+
+def evict(conn):
+    """Delete least recently used entries until the cache fits OCR_CACHE_MAX_BYTES."""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+    if total <= OCR_CACHE_MAX_BYTES:
+        return
+
+    stale = []
+    for key, size in conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access"):
+        if total <= OCR_CACHE_MAX_BYTES:
+            break
+        stale.append((key,))
+        total -= size
+    conn.executemany("DELETE FROM ocr_cache WHERE key = ?", stale)
@@ -0,0 +1,99 @@
+const { spawn } = require("child_process");
+const path = require("path");
+const readline = require("readline");
+
+const SCRIPT_PATH = path.join(__dirname, "../scripts/classify.py");
+const POOL_SIZE = parseInt(process.env.CLASSIFY_WORKERS, 10) || 2;
+const JOB_TIMEOUT_MS = parseInt(process.env.CLASSIFY_TIMEOUT_MS, 10) || 5 * 60 * 1000;
+
+let nextJobId = 1;
+const workers = [];
+
+// Start a long-lived classify.py process that reads jobs as JSON lines
+const startWorker = (slot) => {
+  const proc = spawn("python3", [SCRIPT_PATH, "--worker"]);
+  const worker = { proc, slot, pending: new Map() };
+
+  readline.createInterface({ input: proc.stdout }).on("line", (line) => {
+    let result;
+    try {
+      result = JSON.parse(line);
+    } catch (err) {
+      console.error("Invalid line from classification worker:", line);
+      return;
+    }
+
+    const job = worker.pending.get(result.id);
+    if (!job) return;
+
+    worker.pending.delete(result.id);
+    clearTimeout(job.timer);
+    delete result.id;
+    job.resolve(result);
+  });
+
+  proc.stderr.on("data", (data) => {
+    console.error(`Python Error: ${data}`);
+  });
+
+  proc.on("exit", (code) => {
+    console.error(`Classification worker exited with code ${code}`);
+    retireWorker(worker, "Classification worker exited");
+  });
+
+  // A worker that fails to spawn may never emit "exit"
+  proc.on("error", (err) => {
+    console.error("Error starting classification worker:", err);
+    retireWorker(worker, "Classification worker failed to start");
+  });
+
+  proc.stdin.on("error", (err) => {
+    console.error("Error writing to classification worker:", err);
+  });
+
+  workers[slot] = worker;
+  return worker;
+};
+
+// Free a worker's slot and fail whatever was in flight; the next job starts a fresh worker
+const retireWorker = (worker, reason) => {
+  if (workers[worker.slot] === worker) workers[worker.slot] = null;
+
+  for (const job of worker.pending.values()) {
+    clearTimeout(job.timer);
+    job.reject(new Error(reason));
+  }
+  worker.pending.clear();
+};
+
+// Pick the worker with the fewest jobs in flight, starting it if needed
+const acquireWorker = () => {
+  let best = null;
+  for (let slot = 0; slot < POOL_SIZE; slot++) {
+    const worker = workers[slot] || startWorker(slot);
+    if (!best || worker.pending.size < best.pending.size) best = worker;
+  }
+  return best;
+};
+
+// Classify a file on a warm worker and resolve with the parsed JSON result
+const classifyFile = (filePath) =>
+  new Promise((resolve, reject) => {
+    const worker = acquireWorker();
+    const id = nextJobId++;
+
+    const timer = setTimeout(() => {
+      worker.pending.delete(id);
+      reject(new Error("Classification timed out"));
+
+      // The worker is still busy with the stuck job and would hold up every
+      // job queued behind it; replace it with a fresh one
+      retireWorker(worker, "Classification worker restarted after a timeout");
+      worker.proc.kill();
+    }, JOB_TIMEOUT_MS);
+
+    worker.pending.set(id, { resolve, reject, timer });
+    worker.proc.stdin.write(JSON.stringify({ id, path: filePath }) + "\n");
+  });
+
+module.exports = { classifyFile };
@@ -0,0 +1,195 @@
+"""
+Local cache of FinEase Assistant answers
+
+Most assistant questions are repeats ("GST due date", "how to file ITR"),
+so answers are cached by normalized question text and served without
+calling Gemini. When a similarity threshold below 1 is configured, a
+question that isn't an exact repeat can still hit if its character
+trigrams are close enough to a cached question and it names the same
+numbers, years and forms. Answers are partitioned by who asked (e.g.
+authenticated or not), expire after a TTL and are evicted least recently
+used first. Only answers generated without earlier conversation are
+cached, so one user's details never reach another user's answer.
+"""
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from config import ANSWER_CACHE, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY
+
+logger = logging.getLogger(__name__)
+
+# Words that make a question depend on the conversation before it or on
+# the asker's own circumstances
+CONTEXT_WORDS = frozenset([
+    'it', 'its', 'that', 'this', 'these', 'those', 'they', 'them', 'their',
+    'he', 'she', 'him', 'her', 'above', 'previous', 'earlier', 'again', 'more', 'else',
+    'i', 'me', 'my', 'mine', 'myself', 'we', 'us', 'our', 'ours', 'ourselves'
+])
+
+# Terms that change the answer however similar the rest of the question is;
+# words containing digits (years, amounts, GSTR-3B, ITR-2) count too
+FORM_WORDS = frozenset([
+    'gst', 'gstr', 'igst', 'cgst', 'sgst', 'itr', 'epf', 'pf', 'esi', 'uan',
+    'tds', 'tcs', 'pan', 'tan', 'gstin', 'hsn', 'sac'
+])
+
+# Log the hit rate after this many lookups
+REPORT_EVERY = 100
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9\s]", " ", question.lower()).split())
+
+def is_standalone(question):
+    """Whether a question can be answered without the conversation before it"""
+    words = normalize_question(question).split()
+    return bool(words) and not CONTEXT_WORDS.intersection(words)
+
+def key_terms(text):
+    """Numbers and form identifiers in normalized text"""
+    return frozenset(word for word in text.split() if word in FORM_WORDS or any(c.isdigit() for c in word))
+
+def has_context(chat_history, question):
+    """Whether chat history holds anything besides the question itself"""
+    history = chat_history or []
+    if history and history[-1]['role'] == 'user' and history[-1]['content'] == question:
+        history = history[:-1]
+    return bool(history)
+
+def trigrams(text):
+    """Character trigrams of text, padded so short words count"""
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class AnswerCache:
+    """TTL and LRU bounded answer cache with a trigram similarity index per partition"""
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 similarity=ANSWER_CACHE_SIMILARITY, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.clock = clock
+        # (partition, question) -> (expires_at, answer, trigrams), oldest first
+        self._entries = OrderedDict()
+        # partition -> trigram -> questions containing it
+        self._index = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(self, question, partition=None):
+        """Return a cached answer for question, or None"""
+        normalized = normalize_question(question)
+        with self._lock:
+            key = (partition, normalized)
+            if key not in self._entries and self.similarity < 1:
+                key = self._find_similar(partition, normalized)
+
+            entry = self._entries.get(key) if key else None
+            if entry is not None and entry[0] <= self.clock():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                answer = None
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if key[1] != normalized:
+                    self.similar_hits += 1
+                answer = entry[1]
+
+            lookups = self.hits + self.misses
+        if lookups % REPORT_EVERY == 0:
+            logger.info(f"Answer cache: {self.stats()}")
+        return answer
+
+    def put(self, question, answer, partition=None):
+        """Cache answer for question"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        grams = trigrams(normalized)
+        with self._lock:
+            key = (partition, normalized)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + self.ttl, answer, grams)
+            index = self._index.setdefault(partition, {})
+            for gram in grams:
+                index.setdefault(gram, set()).add(normalized)
+            self._evict()
+
+    def _find_similar(self, partition, normalized):
+        """Key of the most similar cached question at or above the threshold, or None"""
+        index = self._index.get(partition)
+        if not index:
+            return None
+
+        grams = trigrams(normalized)
+        shared = {}
+        for gram in grams:
+            for question in index.get(gram, ()):
+                shared[question] = shared.get(question, 0) + 1
+
+        terms = key_terms(normalized)
+        best, best_score = None, self.similarity
+        for question, count in shared.items():
+            other = self._entries[(partition, question)][2]
+            score = count / (len(grams) + len(other) - count)
+            if score >= best_score and key_terms(question) == terms:
+                best, best_score = question, score
+        return (partition, best) if best is not None else None
+
+    def _remove(self, key):
+        _, _, grams = self._entries.pop(key)
+        index = self._index[key[0]]
+        for gram in grams:
+            questions = index.get(gram)
+            if questions is not None:
+                questions.discard(key[1])
+                if not questions:
+                    del index[gram]
+
+    def _evict(self):
+        """Drop expired entries from the old end, then the least recently used over the limit"""
+        now = self.clock()
+        while self._entries:
+            key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._remove(key)
+
+    def stats(self):
+        """Hit and miss counts and the hit rate"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+# Cache shared by every assistant call in this process
+answer_cache = AnswerCache()
+
+def chat_partition(is_authenticated):
+    """Cache partition for assistant answers; logged-in users get a different system prompt"""
+    return 'authenticated' if is_authenticated else 'guest'
+
+def lookup_answer(question, partition):
+    """Cached answer for a standalone question, or None"""
+    if not ANSWER_CACHE or not is_standalone(question):
+        return None
+    return answer_cache.get(question, partition)
+
+def store_answer(question, answer, partition, chat_history=None):
+    """Cache the answer to a standalone question, unless earlier conversation went into it"""
+    if ANSWER_CACHE and answer and is_standalone(question) and not has_context(chat_history, question):
+        answer_cache.put(question, answer, partition)
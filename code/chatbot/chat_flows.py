@@ -0,0 +1,95 @@
+"""
+Background answering of FinEase Assistant questions
+
+The webhook queues the question and returns; the answer is streamed from
+Gemini and each paragraph is sent as a WhatsApp message as soon as it is
+complete, so long answers start arriving before generation finishes.
+Repeated standalone questions are answered from the local answer cache.
+
+Chat jobs run on their own pool, never behind document uploads, and each
+user's questions are answered one at a time in the order they were asked.
+"""
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import session_manager
+from config import CHAT_WORKERS, CHAT_QUEUE_SIZE
+from gemini_helper import stream_chat_response, BUSY_MESSAGE
+from resilience import ProviderUnavailable
+from answer_cache import chat_partition, lookup_answer, store_answer
+from messaging import queue_message, stream_message_chunks
+
+# Questions waiting per sender; a sender has an entry while a drain task runs for them
+_chat_queues = {}
+_chat_lock = threading.Lock()
+_queued_chats = 0
+
+_chat_pool = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat")
+
+def enqueue_chat(sender, user_message, is_authenticated):
+    """Queue a question to be answered after the sender's earlier ones; returns False if too many are waiting"""
+    global _queued_chats
+    with _chat_lock:
+        if _queued_chats >= CHAT_QUEUE_SIZE:
+            print("Chat queue full, rejecting question")
+            return False
+        _queued_chats += 1
+
+        questions = _chat_queues.get(sender)
+        if questions is None:
+            questions = _chat_queues[sender] = deque()
+            _chat_pool.submit(_drain_chats, sender)
+        questions.append((user_message, is_authenticated))
+    return True
+
+def _drain_chats(sender):
+    """Answer a sender's queued questions in order until none are left"""
+    global _queued_chats
+    while True:
+        with _chat_lock:
+            questions = _chat_queues[sender]
+            if not questions:
+                del _chat_queues[sender]
+                return
+            user_message, is_authenticated = questions.popleft()
+            _queued_chats -= 1
+
+        try:
+            process_chat_job(sender, user_message, is_authenticated)
+        except Exception as e:
+            print(f"Error in chat job: {e}")
+            traceback.print_exc()
+
+def process_chat_job(sender, user_message, is_authenticated):
+    """Stream an assistant answer to the user and store the question and answer in their chat history"""
+    # Recorded here rather than in the webhook, so the history this answer is
+    # built from ends with this question even if the user has asked another
+    session_manager.add_to_chat_history(sender, 'user', user_message)
+
+    partition = chat_partition(is_authenticated)
+    cached = lookup_answer(user_message, partition)
+    chat_history = session_manager.get_chat_history(sender) if cached is None else None
+    sent = []
+
+    try:
+        fragments = [cached] if cached is not None else stream_chat_response(user_message, chat_history, is_authenticated)
+        for chunk in stream_message_chunks(fragments):
+            queue_message(sender, f"🤖 {chunk}")
+            sent.append(chunk)
+        complete = True
+    except ProviderUnavailable as e:
+        print(f"Skipping Gemini chat: {e}")
+        queue_message(sender, f"⚠️ {BUSY_MESSAGE}")
+        complete = False
+    except Exception as e:
+        print(f"Error with Gemini chat: {e}")
+        queue_message(sender, "⚠️ I'm having trouble connecting to my knowledge base. Please try again later.")
+        complete = False
+
+    # Store what the user received in chat history
+    if sent:
+        answer = "\n\n".join(sent)
+        session_manager.add_to_chat_history(sender, 'assistant', answer)
+        if complete and cached is None:
+            store_answer(user_message, answer, partition, chat_history)
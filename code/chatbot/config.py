@@ -27,6 +27,95 @@ APP_DIR = os.path.dirname(os.path.abspath(__file__))
 # Media folder configuration
 MEDIA_FOLDER = os.path.join(APP_DIR, 'media')
 
+# Downloaded media larger than this many bytes is spooled to the media folder
+# instead of being kept in memory
+MEDIA_SPOOL_BYTES = int(os.getenv('MEDIA_SPOOL_BYTES', str(5 * 1024 * 1024)))
+
+# Session storage: 'memory' keeps up to SESSION_MAX sessions in this process;
+# 'sqlite' persists them in SESSION_DB_PATH and shares them between workers.
+# Sessions idle for SESSION_TTL seconds are dropped.
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join(APP_DIR, 'sessions.sqlite3'))
+SESSION_TTL = int(os.getenv('SESSION_TTL', str(7 * 24 * 60 * 60)))
+SESSION_MAX = int(os.getenv('SESSION_MAX', '50000'))
+
+# Lock stripes guarding session updates
+SESSION_LOCK_STRIPES = int(os.getenv('SESSION_LOCK_STRIPES', '64'))
+
+# Background processing of uploaded documents
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '100'))
+
+# Outbound HTTP connection pooling, timeouts (seconds) and retries
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.5'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+
+# Read timeout for OCR-heavy calls (backend classification, Nanonets extraction)
+PROCESSING_TIMEOUT = float(os.getenv('PROCESSING_TIMEOUT', '180'))
+
+# Send files to the backend as streamed multipart uploads; set to 0 to use
+# the base64 JSON endpoint
+STREAMING_UPLOAD = os.getenv('STREAMING_UPLOAD', '1') == '1'
+
+# Attachments downloaded and processed at once across all queued jobs
+ATTACHMENT_WORKERS = int(os.getenv('ATTACHMENT_WORKERS', '4'))
+
+# Start Nanonets extraction for GST/ITR/PF uploads while the backend is still
+# classifying them; set SPECULATIVE_EXTRACTION=0 to extract only after a match
+SPECULATIVE_EXTRACTION = os.getenv('SPECULATIVE_EXTRACTION', '1') == '1'
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '4'))
+
+# Gemini validation and file saves run alongside the typed-table save
+FOLLOWUP_WORKERS = int(os.getenv('FOLLOWUP_WORKERS', '8'))
+
+# Outbound WhatsApp messages: concurrent sends across recipients, and the
+# longest body sent in a single message
+MESSAGE_SEND_WORKERS = int(os.getenv('MESSAGE_SEND_WORKERS', '8'))
+WHATSAPP_MESSAGE_LIMIT = 1500
+
+# Approximate tokens of earlier chat turns sent with each Gemini question;
+# older turns are summarized
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+
+# Stream assistant answers to WhatsApp paragraph by paragraph; paragraphs are
+# grouped until a message holds at least CHAT_STREAM_MIN_CHARS characters
+CHAT_STREAMING = os.getenv('CHAT_STREAMING', '1') == '1'
+CHAT_STREAM_MIN_CHARS = int(os.getenv('CHAT_STREAM_MIN_CHARS', '300'))
+
+# Assistant questions are answered on their own pool, so long document jobs
+# never hold up a reply; each user's questions are answered in order
+CHAT_WORKERS = int(os.getenv('CHAT_WORKERS', '4'))
+CHAT_QUEUE_SIZE = int(os.getenv('CHAT_QUEUE_SIZE', '100'))
+
+# Cache assistant answers to standalone questions; below 1, a question also
+# hits when its trigram similarity to a cached one is at least
+# ANSWER_CACHE_SIMILARITY and both name the same numbers and forms
+ANSWER_CACHE = os.getenv('ANSWER_CACHE', '1') == '1'
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1000'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '86400'))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '1'))
+
+# Calls to Gemini and Nanonets: requests per second with bursts, calls in
+# progress at once, and seconds a call may wait for either before failing
+GEMINI_RATE = float(os.getenv('GEMINI_RATE', '5'))
+GEMINI_BURST = int(os.getenv('GEMINI_BURST', '10'))
+GEMINI_CONCURRENCY = int(os.getenv('GEMINI_CONCURRENCY', '8'))
+NANONETS_RATE = float(os.getenv('NANONETS_RATE', '2'))
+NANONETS_BURST = int(os.getenv('NANONETS_BURST', '5'))
+NANONETS_CONCURRENCY = int(os.getenv('NANONETS_CONCURRENCY', '4'))
+PROVIDER_WAIT = float(os.getenv('PROVIDER_WAIT', '10'))
+
+# Circuit breaker: stop calling a provider for BREAKER_RESET seconds once at
+# least BREAKER_FAILURE_RATE of BREAKER_MIN_CALLS or more calls in the last
+# BREAKER_WINDOW seconds failed
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', '60'))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', '30'))
+
 # Document type options
 DOCUMENT_OPTIONS = ['gst_filing', 'itr_filing', 'pf_filing', 'classify', 'authenticate', 'ask_gemini']
 
@@ -0,0 +1,407 @@
+"""
+Background processing of documents uploaded over WhatsApp
+
+The webhook only queues these jobs and acknowledges the message; all
+downloading, classification, extraction and saving happens here, and the
+results are sent to the user as separate WhatsApp messages.
+"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from media_buffer import MediaBuffer
+from utils import (
+    get_file_extension,
+    download_media_buffer,
+    format_menu,
+    save_to_database,
+    save_extracted_data_to_specific_table
+)
+from document_processors import (
+    classify_document,
+    extract_gst_data,
+    extract_itr_data,
+    extract_epf_data
+)
+from formatters import (
+    format_gst_data_for_whatsapp,
+    format_itr_data_for_whatsapp,
+    format_epf_data_for_whatsapp,
+    format_classification_result
+)
+from gemini_helper import analyze_document_content, validate_document
+from messaging import queue_message, queue_messages, split_message
+
+# Attachments of all queued jobs are downloaded and processed on this pool,
+# so a message with many files doesn't hold more than its share of workers
+_attachment_pool = ThreadPoolExecutor(max_workers=config.ATTACHMENT_WORKERS, thread_name_prefix="attachment")
+
+# Speculative Nanonets extractions run here rather than on the attachment
+# pool, so an attachment task never waits on a slot its own pool holds
+_extraction_pool = ThreadPoolExecutor(max_workers=config.EXTRACTION_WORKERS, thread_name_prefix="extraction")
+
+# Post-extraction steps (Gemini validation, file save) fanned out per document
+_followup_pool = ThreadPoolExecutor(max_workers=config.FOLLOWUP_WORKERS, thread_name_prefix="followup")
+
+# How each filing option recognises its documents and extracts their data
+FILING_FLOWS = {
+    'gst_filing': {
+        'name': 'GST',
+        'document_name': 'GST',
+        'result_type': 'gst',
+        'keywords': ('gst', 'invoice', 'tax'),
+        'extract': extract_gst_data
+    },
+    'itr_filing': {
+        'name': 'ITR',
+        'document_name': 'ITR',
+        'result_type': 'itr',
+        'keywords': ('itr', 'income tax', 'form 16'),
+        'extract': extract_itr_data
+    },
+    'pf_filing': {
+        'name': 'PF',
+        'document_name': 'EPF',
+        'result_type': 'epf',
+        'keywords': ('epf', 'pf', 'provident'),
+        'extract': extract_epf_data
+    }
+}
+
+def send_extraction_results(to_number, data, document_type, label=""):
+    """Send extraction results directly without going through the webhook response"""
+    try:
+        # Format the message based on document type
+        if document_type == 'gst':
+            message = format_gst_data_for_whatsapp(data)
+        elif document_type == 'itr':
+            message = format_itr_data_for_whatsapp(data)
+        elif document_type == 'epf':
+            message = format_epf_data_for_whatsapp(data)
+        else:
+            message = f"✅ Data extracted successfully!\n\n{str(data)}"
+
+        # Clean the phone number - remove "whatsapp:" prefix if present
+        if to_number.startswith('whatsapp:'):
+            clean_number = to_number.replace('whatsapp:', '')
+        else:
+            clean_number = to_number
+
+        print(f"Sending extraction results to {clean_number}: {message[:100]}...")
+
+        # Queue the message; it goes out after anything already sent to this user
+        queue_message(clean_number, label + message)
+        return True
+    except Exception as e:
+        print(f"Error sending extraction results: {e}")
+        return False
+
+def get_option_details(selected_option):
+    """Get the display name and emoji for a menu option key"""
+    option = next((o for o in config.MENU_OPTIONS.values() if o['key'] == selected_option), None)
+    if option:
+        return option['name'], option['emoji']
+    return selected_option, "📎"
+
+def attachment_label(index, total):
+    """Prefix identifying which attachment a message is about, or "" for a single file"""
+    if total == 1:
+        return ""
+    return f"📎 *File {index + 1} of {total}*\n"
+
+def download_attachment(media_url, content_type, prefix, index):
+    """Download one attachment into a MediaBuffer; returns (media, content_type, original_name) or None"""
+    media_extension = get_file_extension(content_type)
+    original_filename = os.path.basename(media_url)
+    media_filename = f"{prefix}_{index}_{original_filename}.{media_extension}"
+
+    media = download_media_buffer(media_url, media_filename, content_type)
+    if media is None:
+        return None
+    return media, content_type, original_filename
+
+def download_attachments(media_items, prefix):
+    """Download (media_url, content_type) pairs concurrently into MediaBuffers the caller must close"""
+    futures = [
+        _attachment_pool.submit(download_attachment, media_url, content_type, prefix, i)
+        for i, (media_url, content_type) in enumerate(media_items)
+    ]
+    return [media_file for media_file in (future.result() for future in futures) if media_file]
+
+def close_media_files(media_files):
+    """Release the buffers of downloaded attachments"""
+    for media, _, _ in media_files:
+        media.close()
+
+def handle_classification(sender, media_file, user_id, label=""):
+    """Classify an uploaded document and report the result"""
+    media, content_type, original_name = media_file
+
+    print(f"Sending file to classification: {media}")
+    classification_result = classify_document(media)
+    print(f"Classification result: {classification_result}")
+
+    if "error" in classification_result:
+        queue_message(sender, f"{label}⚠️ *Classification Error*\n\n{classification_result['error']}")
+        return
+
+    # Format and send the classification result
+    queue_message(sender, label + format_classification_result(classification_result))
+
+    # If Gemini API is available, provide additional analysis
+    if config.GEMINI_API_KEY:
+        document_type = classification_result.get('classification', 'document').lower()
+
+        # Send a message that Gemini is analyzing the document
+        queue_message(sender, f"{label}🤖 *Using AI to analyze your document...*")
+
+        try:
+            # For PDFs or images, we would need OCR first
+            # Here we'll simulate with a simple example
+            sample_text = f"This is a sample {document_type} document for analysis."
+            analysis = analyze_document_content(sample_text, document_type)
+
+            # Send the analysis in chunks if it's too long
+            if len(analysis) > config.WHATSAPP_MESSAGE_LIMIT:  # WhatsApp character limit is around 4096
+                chunks = split_message(analysis)
+                queue_messages(sender, [
+                    f"{label}🔍 *AI Document Analysis* (Part {i} of {len(chunks)})\n\n{chunk}"
+                    for i, chunk in enumerate(chunks, 1)
+                ])
+            else:
+                queue_message(sender, f"{label}🔍 *AI Document Analysis*\n\n{analysis}")
+        except Exception as e:
+            print(f"Error with Gemini analysis: {e}")
+
+    # Save the file to the database
+    save_to_database(
+        file_path=media,
+        user_id=user_id,
+        original_name=original_name,
+        mime_type=content_type,
+        document_type='classify',
+        classification=classification_result.get('classification', 'Unknown'),
+        extracted_data={},
+        whatsapp_number=sender
+    )
+    queue_message(sender, f"{label}✅ Your document has been saved to your account.")
+
+def send_validation_note(sender, extraction_result, document_name, label=""):
+    """Validate extracted data with Gemini and send any issues it finds"""
+    try:
+        validation_result = validate_document(json.dumps(extraction_result, indent=2), document_name)
+
+        # If there are any validation issues, send them to the user
+        if "issue" in validation_result.lower() or "missing" in validation_result.lower():
+            queue_message(sender, f"{label}⚠️ *Validation Note*\n\n{validation_result}")
+    except Exception as e:
+        print(f"Gemini validation error: {e}")
+
+def discard_extraction(extraction_future):
+    """Cancel a speculative extraction, or ignore its result if it already started"""
+    if extraction_future is not None and not extraction_future.cancel():
+        print("Discarding speculative extraction result")
+
+def handle_filing(sender, selected_option, media_file, user_id, user_email, label=""):
+    """Classify an uploaded document and, if it matches the filing type, extract and save its data"""
+    flow = FILING_FLOWS[selected_option]
+    _, option_emoji = get_option_details(selected_option)
+    media, content_type, original_name = media_file
+
+    # Start extracting for the selected filing type while the backend classifies;
+    # the result is dropped if the document turns out to be something else
+    extraction_future = None
+    if config.SPECULATIVE_EXTRACTION:
+        # A discarded extraction may still be running after this attachment's
+        # media is closed, so it holds the buffer open until it finishes
+        if isinstance(media, MediaBuffer):
+            media.retain()
+        extraction_future = _extraction_pool.submit(flow['extract'], media, user_email)
+        if isinstance(media, MediaBuffer):
+            extraction_future.add_done_callback(lambda _: media.close())
+
+    # First classify the document
+    print(f"Classifying document: {media}")
+    try:
+        classification_result = classify_document(media)
+    except Exception:
+        discard_extraction(extraction_future)
+        raise
+    print(f"Classification result: {classification_result}")
+
+    if "error" in classification_result:
+        discard_extraction(extraction_future)
+        queue_message(sender, f"{label}⚠️ *Classification Error*\n\n{classification_result['error']}")
+        return
+
+    document_type = classification_result.get('classification', 'Unknown').lower()
+    print(f"Document classified as: {document_type}")
+
+    # Send classification result
+    queue_message(sender, f"{label}{option_emoji} Document classified as: *{document_type}*")
+
+    # Only process if the document type matches the selected filing
+    if not any(keyword in document_type for keyword in flow['keywords']):
+        discard_extraction(extraction_future)
+        queue_message(
+            sender,
+            f"{label}⚠️ This doesn't appear to be a {flow['name']} document. Classified as: *{document_type}*\n\n"
+            f"Please try uploading a valid {flow['name']} document."
+        )
+
+        # Save the file to the database
+        save_to_database(
+            file_path=media,
+            user_id=user_id,
+            original_name=original_name,
+            mime_type=content_type,
+            document_type=selected_option,
+            classification=document_type,
+            extracted_data={},
+            whatsapp_number=sender
+        )
+        queue_message(sender, f"{label}✅ Your document has been saved to your account.")
+        return
+
+    # Now send the processing message
+    queue_message(sender, f"{label}{option_emoji} Processing your {flow['name']} document...")
+
+    # Extract data with the session user's email
+    if extraction_future is not None:
+        extraction_result = extraction_future.result()
+    else:
+        extraction_result = flow['extract'](media, user_email)
+    print(f"{flow['name']} Extraction result: {extraction_result}")
+
+    # Validation and the file save don't depend on each other or on the
+    # typed-table save, so they run alongside it
+    validation_future = None
+    if config.GEMINI_API_KEY and "error" not in extraction_result:
+        validation_future = _followup_pool.submit(
+            send_validation_note, sender, extraction_result, flow['document_name'], label
+        )
+
+    file_save_future = _followup_pool.submit(
+        save_to_database,
+        file_path=media,
+        user_id=user_id,
+        original_name=original_name,
+        mime_type=content_type,
+        document_type=selected_option,
+        classification=document_type,
+        extracted_data=extraction_result,
+        whatsapp_number=sender
+    )
+
+    # Format and send the result straight away
+    send_extraction_results(sender, extraction_result, flow['result_type'], label)
+
+    # Save to the table for this document type
+    save_result = save_extracted_data_to_specific_table(
+        extracted_data=extraction_result,
+        document_type=document_type,
+        email=user_email
+    )
+
+    if not file_save_future.result():
+        queue_message(sender, f"{label}⚠️ Note: The original file could not be saved to your account.")
+
+    if save_result['success']:
+        queue_message(sender, f"{label}✅ Your {flow['document_name']} document has been saved and processed successfully.")
+    else:
+        queue_message(sender, f"{label}⚠️ Note: {save_result['message']}")
+
+    # Wait for validation so its note arrives before the menu
+    if validation_future is not None:
+        validation_future.result()
+
+def handle_upload(sender, selected_option, media_files, user_id):
+    """Save uploaded documents for options without special processing"""
+    option_name, option_emoji = get_option_details(selected_option)
+
+    if len(media_files) == 1:
+        queue_message(sender, f"{option_emoji} *Success!* Your document has been uploaded to *{option_name}*.")
+    else:
+        queue_message(sender, f"{option_emoji} *Success!* Your {len(media_files)} documents have been uploaded to *{option_name}*.")
+
+    # Save all files to database
+    for media, content_type, original_name in media_files:
+        save_to_database(
+            file_path=media,
+            user_id=user_id,
+            original_name=original_name,
+            mime_type=content_type,
+            document_type=selected_option,
+            classification="Unknown",
+            extracted_data={},
+            whatsapp_number=sender
+        )
+    queue_message(sender, "✅ Your document(s) have been saved to your account.")
+
+def process_attachment(sender, selected_option, media_item, index, total, user_id, user_email):
+    """Download and classify or extract one attachment, reporting its results as soon as they are ready"""
+    label = attachment_label(index, total)
+    media_url, content_type = media_item
+
+    media_file = download_attachment(media_url, content_type, "document", index)
+    if media_file is None:
+        queue_message(sender, f"{label}⚠️ *Error processing document*\n\nThe file could not be downloaded.")
+        return
+
+    try:
+        if selected_option == 'classify':
+            handle_classification(sender, media_file, user_id, label)
+        else:
+            handle_filing(sender, selected_option, media_file, user_id, user_email, label)
+    except Exception as e:
+        print(f"Error processing document: {e}")
+        queue_message(sender, f"{label}⚠️ *Error processing document*\n\n{str(e)}")
+    finally:
+        close_media_files([media_file])
+
+def process_document_job(sender, selected_option, media_items, user_id, user_email):
+    """Download, process and report on documents uploaded for a menu option, then show the menu once"""
+    # user_id and user_email are the account that was logged in when the
+    # webhook accepted the upload, even if the session has changed since
+    if selected_option == 'classify' or selected_option in FILING_FLOWS:
+        # Every attachment is processed concurrently on the shared pool
+        futures = [
+            _attachment_pool.submit(
+                process_attachment, sender, selected_option, media_item, i, len(media_items), user_id, user_email
+            )
+            for i, media_item in enumerate(media_items)
+        ]
+        for future in futures:
+            future.result()
+    else:
+        media_files = download_attachments(media_items, "document")
+        try:
+            handle_upload(sender, selected_option, media_files, user_id)
+        except Exception as e:
+            print(f"Error processing document: {e}")
+            queue_message(sender, f"⚠️ *Error processing document*\n\n{str(e)}")
+        finally:
+            close_media_files(media_files)
+
+    # Show the menu again after document upload
+    queue_message(sender, format_menu())
+
+def process_unsolicited_media_job(sender, media_items, user_id):
+    """Download and save media sent without selecting a menu option first"""
+    # user_id is the account that was logged in when the webhook accepted the media
+    media_files = download_attachments(media_items, "received_media")
+
+    for media, content_type, original_name in media_files:
+        save_to_database(
+            file_path=media,
+            user_id=user_id,
+            original_name=original_name,
+            mime_type=content_type,
+            document_type="unknown",
+            classification="Unknown",
+            extracted_data={},
+            whatsapp_number=sender
+        )
+
+    close_media_files(media_files)
@@ -1,7 +1,11 @@
 import os
-import requests
+import http_client
+from resilience import nanonets, server_error, ProviderUnavailable
+from media_buffer import MediaBuffer, media_name, media_content_type
 from config import (
     BACKEND_URL, 
+    HTTP_CONNECT_TIMEOUT,
+    PROCESSING_TIMEOUT,
     NANONETS_API_KEY, 
     GST_MODEL_ID, 
     ITR_MODEL_ID, 
@@ -12,29 +16,35 @@ from config import (
 def classify_document(file_path):
     """Send a document to the backend classification API and return the result"""
     try:
-        # Make sure we're using the absolute file path
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(APP_DIR, file_path)
-            
-        # Verify the file exists before attempting to open it
-        if not os.path.exists(file_path):
-            return {"error": f"File not found: {file_path}"}
+        # Downloaded media is already in a buffer; paths must point to an existing file
+        if not isinstance(file_path, MediaBuffer):
+            # Make sure we're using the absolute file path
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(APP_DIR, file_path)
+                
+            # Verify the file exists before attempting to open it
+            if not os.path.exists(file_path):
+                return {"error": f"File not found: {file_path}"}
             
         print(f"Attempting to classify file: {file_path}")
         
-        # Prepare the file for upload
-        with open(file_path, 'rb') as f:
-            files = {'file': f}
-            
-            # Send the file to the classification API
-            response = requests.post(f"{BACKEND_URL}/api/classify", files=files)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result
-            else:
-                print(f"Classification API error: {response.status_code}, {response.text}")
-                return {"error": f"Classification failed with status code: {response.status_code}"}
+        # Stream the file to the classification API
+        response = http_client.post_file(
+            f"{BACKEND_URL}/api/classify",
+            {},
+            'file',
+            file_path,
+            media_name(file_path),
+            media_content_type(file_path),
+            timeout=(HTTP_CONNECT_TIMEOUT, PROCESSING_TIMEOUT)
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            return result
+        else:
+            print(f"Classification API error: {response.status_code}, {response.text}")
+            return {"error": f"Classification failed with status code: {response.status_code}"}
                 
     except Exception as e:
         print(f"Error classifying document: {e}")
@@ -43,40 +53,48 @@ def classify_document(file_path):
 def extract_gst_data(file_path, user_email=None):
     """Extract data from GST document using Nanonets API"""
     try:
-        # Make sure we're using the absolute file path
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(APP_DIR, file_path)
-            
-        # Verify the file exists before attempting to open it
-        if not os.path.exists(file_path):
-            return {"error": f"File not found: {file_path}"}
+        # Downloaded media is already in a buffer; paths must point to an existing file
+        if not isinstance(file_path, MediaBuffer):
+            # Make sure we're using the absolute file path
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(APP_DIR, file_path)
+                
+            # Verify the file exists before attempting to open it
+            if not os.path.exists(file_path):
+                return {"error": f"File not found: {file_path}"}
             
         print(f"Extracting data from GST file: {file_path}")
         
-        # Prepare the file for upload
-        with open(file_path, 'rb') as f:
-            # Create a multipart form request
-            files = {'file': f}
-            
-            # Send file to Nanonets API
-            response = requests.post(
-                f"https://app.nanonets.com/api/v2/OCR/Model/{GST_MODEL_ID}/LabelFile/",
-                files=files,
-                auth=(NANONETS_API_KEY, '')  # Basic auth with API key
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                # Process the extracted data
-                if result and 'result' in result:
-                    extracted_data = process_gst_response(result, user_email)
-                    return extracted_data
-                else:
-                    return {"error": "Could not extract data from the invoice"}
+        # Stream the file to Nanonets API as a multipart form request
+        response = nanonets.call(
+            http_client.post_file,
+            f"https://app.nanonets.com/api/v2/OCR/Model/{GST_MODEL_ID}/LabelFile/",
+            {},
+            'file',
+            file_path,
+            media_name(file_path),
+            media_content_type(file_path),
+            auth=(NANONETS_API_KEY, ''),  # Basic auth with API key
+            timeout=(HTTP_CONNECT_TIMEOUT, PROCESSING_TIMEOUT),
+            is_failure=server_error
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            # Process the extracted data
+            if result and 'result' in result:
+                extracted_data = process_gst_response(result, user_email)
+                return extracted_data
             else:
-                print(f"Nanonets API error: {response.status_code}, {response.text}")
-                return {"error": f"Data extraction failed with status code: {response.status_code}"}
+                return {"error": "Could not extract data from the invoice"}
+        else:
+            print(f"Nanonets API error: {response.status_code}, {response.text}")
+            return {"error": f"Data extraction failed with status code: {response.status_code}"}
                 
+    except ProviderUnavailable as e:
+        print(f"Skipping GST extraction: {e}")
+        return {"error": "Data extraction is busy right now. Please try again in a few minutes."}
+
     except Exception as e:
         print(f"Error extracting GST data: {e}")
         return {"error": f"Data extraction error: {str(e)}"}
@@ -84,40 +102,48 @@ def extract_gst_data(file_path, user_email=None):
 def extract_itr_data(file_path, user_email=None):
     """Extract data from ITR document using Nanonets API"""
     try:
-        # Make sure we're using the absolute file path
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(APP_DIR, file_path)
-            
-        # Verify the file exists before attempting to open it
-        if not os.path.exists(file_path):
-            return {"error": f"File not found: {file_path}"}
+        # Downloaded media is already in a buffer; paths must point to an existing file
+        if not isinstance(file_path, MediaBuffer):
+            # Make sure we're using the absolute file path
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(APP_DIR, file_path)
+                
+            # Verify the file exists before attempting to open it
+            if not os.path.exists(file_path):
+                return {"error": f"File not found: {file_path}"}
             
         print(f"Extracting data from ITR file: {file_path}")
         
-        # Prepare the file for upload
-        with open(file_path, 'rb') as f:
-            # Create a multipart form request
-            files = {'file': f}
-            
-            # Send file to Nanonets API
-            response = requests.post(
-                f"https://app.nanonets.com/api/v2/OCR/Model/{ITR_MODEL_ID}/LabelFile/",
-                files=files,
-                auth=(NANONETS_API_KEY, '')  # Basic auth with API key
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                # Process the extracted data
-                if result and 'result' in result:
-                    extracted_data = process_itr_response(result, user_email)
-                    return extracted_data
-                else:
-                    return {"error": "Could not extract data from the ITR document"}
+        # Stream the file to Nanonets API as a multipart form request
+        response = nanonets.call(
+            http_client.post_file,
+            f"https://app.nanonets.com/api/v2/OCR/Model/{ITR_MODEL_ID}/LabelFile/",
+            {},
+            'file',
+            file_path,
+            media_name(file_path),
+            media_content_type(file_path),
+            auth=(NANONETS_API_KEY, ''),  # Basic auth with API key
+            timeout=(HTTP_CONNECT_TIMEOUT, PROCESSING_TIMEOUT),
+            is_failure=server_error
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            # Process the extracted data
+            if result and 'result' in result:
+                extracted_data = process_itr_response(result, user_email)
+                return extracted_data
             else:
-                print(f"Nanonets API error: {response.status_code}, {response.text}")
-                return {"error": f"Data extraction failed with status code: {response.status_code}"}
+                return {"error": "Could not extract data from the ITR document"}
+        else:
+            print(f"Nanonets API error: {response.status_code}, {response.text}")
+            return {"error": f"Data extraction failed with status code: {response.status_code}"}
                 
+    except ProviderUnavailable as e:
+        print(f"Skipping ITR extraction: {e}")
+        return {"error": "Data extraction is busy right now. Please try again in a few minutes."}
+
     except Exception as e:
         print(f"Error extracting ITR data: {e}")
         return {"error": f"Data extraction error: {str(e)}"}
@@ -125,40 +151,48 @@ def extract_itr_data(file_path, user_email=None):
 def extract_epf_data(file_path, user_email=None):
     """Extract data from EPF document using Nanonets API"""
     try:
-        # Make sure we're using the absolute file path
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(APP_DIR, file_path)
-            
-        # Verify the file exists before attempting to open it
-        if not os.path.exists(file_path):
-            return {"error": f"File not found: {file_path}"}
+        # Downloaded media is already in a buffer; paths must point to an existing file
+        if not isinstance(file_path, MediaBuffer):
+            # Make sure we're using the absolute file path
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(APP_DIR, file_path)
+                
+            # Verify the file exists before attempting to open it
+            if not os.path.exists(file_path):
+                return {"error": f"File not found: {file_path}"}
             
         print(f"Extracting data from EPF file: {file_path}")
         
-        # Prepare the file for upload
-        with open(file_path, 'rb') as f:
-            # Create a multipart form request
-            files = {'file': f}
-            
-            # Send file to Nanonets API
-            response = requests.post(
-                f"https://app.nanonets.com/api/v2/OCR/Model/{EPF_MODEL_ID}/LabelFile/",
-                files=files,
-                auth=(NANONETS_API_KEY, '')  # Basic auth with API key
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                # Process the extracted data
-                if result and 'result' in result:
-                    extracted_data = process_epf_response(result, user_email)
-                    return extracted_data
-                else:
-                    return {"error": "Could not extract data from the EPF document"}
+        # Stream the file to Nanonets API as a multipart form request
+        response = nanonets.call(
+            http_client.post_file,
+            f"https://app.nanonets.com/api/v2/OCR/Model/{EPF_MODEL_ID}/LabelFile/",
+            {},
+            'file',
+            file_path,
+            media_name(file_path),
+            media_content_type(file_path),
+            auth=(NANONETS_API_KEY, ''),  # Basic auth with API key
+            timeout=(HTTP_CONNECT_TIMEOUT, PROCESSING_TIMEOUT),
+            is_failure=server_error
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            # Process the extracted data
+            if result and 'result' in result:
+                extracted_data = process_epf_response(result, user_email)
+                return extracted_data
             else:
-                print(f"Nanonets API error: {response.status_code}, {response.text}")
-                return {"error": f"Data extraction failed with status code: {response.status_code}"}
+                return {"error": "Could not extract data from the EPF document"}
+        else:
+            print(f"Nanonets API error: {response.status_code}, {response.text}")
+            return {"error": f"Data extraction failed with status code: {response.status_code}"}
                 
+    except ProviderUnavailable as e:
+        print(f"Skipping EPF extraction: {e}")
+        return {"error": "Data extraction is busy right now. Please try again in a few minutes."}
+
     except Exception as e:
         print(f"Error extracting EPF data: {e}")
         return {"error": f"Data extraction error: {str(e)}"}
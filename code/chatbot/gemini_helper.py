@@ -3,39 +3,95 @@ Gemini AI integration for WhatsApp chatbot
 """
 import os
 import logging
+import threading
 import google.generativeai as genai
+from config import CHAT_HISTORY_TOKEN_BUDGET
+from answer_cache import chat_partition, lookup_answer, store_answer
+from resilience import gemini, ProviderUnavailable
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Model used for all chatbot requests
+DEFAULT_MODEL = "models/gemini-2.0-flash"
+
+# GenerativeModel instances, built once per (model name, system instruction)
+_models = {}
+_models_lock = threading.Lock()
+
+# Model names returned by the last successful listing
+_available_models = None
+
+# Instructions for the FinEase chat assistant
+CHAT_SYSTEM_PROMPT = """
+You are FinEase Assistant, a helpful financial document processing assistant.
+Your job is to help users with questions about GST, ITR, and EPF filing.
+Be concise, knowledgeable and professional.
+"""
+
+# Rough characters per token, used to keep chat history within its budget
+CHARS_PER_TOKEN = 4
+
+# Longest excerpt of each older turn kept in the history summary
+SUMMARY_EXCERPT_CHARS = 160
+
+# Reply when Gemini calls are being refused to protect the bot
+BUSY_MESSAGE = "FinEase Assistant is very busy right now. Please try again in a minute."
+
 # Initialize Gemini API
 def init_gemini(api_key):
     """Initialize Gemini API with the provided API key"""
     try:
         genai.configure(api_key=api_key)
+        # Models built with a previous key would keep using its client
+        with _models_lock:
+            _models.clear()
         logger.info("Gemini API initialized successfully")
         return True
     except Exception as e:
         logger.error(f"Failed to initialize Gemini API: {e}")
         return False
 
-def get_gemini_models():
-    """List available Gemini models"""
+def get_model(model_name=DEFAULT_MODEL, system_instruction=None):
+    """Get a GenerativeModel from the registry, building it on first use"""
+    key = (model_name, system_instruction)
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                _models[key] = model
+    return model
+
+def get_gemini_models(refresh=False):
+    """List available Gemini models, reusing the last listing unless refresh is set"""
+    global _available_models
+    if _available_models is not None and not refresh:
+        return _available_models
     try:
         models = genai.list_models()
         models_list = [model.name for model in models if "gemini" in model.name.lower()]
         logger.info(f"Available Gemini models: {models_list}")
+        _available_models = models_list
         return models_list
     except Exception as e:
         logger.error(f"Error retrieving Gemini models: {e}")
         return []
 
-def get_response_for_text(prompt, model_name="models/gemini-2.0-flash"):
+def discover_gemini_models():
+    """List available models on a background thread so startup doesn't wait on the network"""
+    thread = threading.Thread(target=get_gemini_models, name="gemini-model-discovery", daemon=True)
+    thread.start()
+    return thread
+
+def get_response_for_text(prompt, model_name=DEFAULT_MODEL):
     """Get Gemini AI response for a text prompt"""
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
+        model = get_model(model_name)
+        with gemini.guard():
+            response = model.generate_content(prompt)
         return response.text
     except Exception as e:
         logger.error(f"Error generating Gemini response: {e}")
@@ -57,48 +113,120 @@ def analyze_document_content(document_text, document_type):
         Format your response in clear sections.
         """
         
-        model = genai.GenerativeModel("models/gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        model = get_model()
+        with gemini.guard():
+            response = model.generate_content(prompt)
         return response.text
     except Exception as e:
         logger.error(f"Error analyzing document with Gemini: {e}")
         return f"Error analyzing document: {str(e)}"
 
+def estimate_tokens(text):
+    """Rough token count of text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def summarize_turns(turns):
+    """Summarize older chat turns locally by keeping the first sentence of each"""
+    lines = []
+    for role, text in turns:
+        excerpt = text.strip().split('\n')[0]
+        for end in ('. ', '? ', '! '):
+            if end in excerpt:
+                excerpt = excerpt[:excerpt.index(end) + 1]
+        if len(excerpt) > SUMMARY_EXCERPT_CHARS:
+            excerpt = excerpt[:SUMMARY_EXCERPT_CHARS].rstrip() + "..."
+        speaker = "User" if role == 'user' else "Assistant"
+        lines.append(f"- {speaker}: {excerpt}")
+    return "Summary of the earlier conversation:\n" + "\n".join(lines)
+
+def build_chat_history(chat_history, user_message, token_budget=CHAT_HISTORY_TOKEN_BUDGET):
+    """
+    Convert session chat history into Gemini contents ending with the current message.
+
+    The newest turns are kept verbatim up to token_budget; older turns are
+    replaced by a short summary. Consecutive turns from the same role are
+    merged so user and model turns alternate.
+    """
+    turns = [
+        ('model' if message['role'] == 'assistant' else 'user', message['content'])
+        for message in chat_history or []
+    ]
+
+    # The current message is usually already in the history; it is sent last
+    if turns and turns[-1] == ('user', user_message):
+        turns.pop()
+
+    # Keep the newest turns that fit the budget
+    kept = []
+    used = estimate_tokens(user_message)
+    while turns and used + estimate_tokens(turns[-1][1]) <= token_budget:
+        kept.insert(0, turns.pop())
+        used += estimate_tokens(kept[0][1])
+
+    if turns:
+        kept.insert(0, ('user', summarize_turns(turns)))
+    kept.append(('user', user_message))
+
+    contents = []
+    for role, text in kept:
+        if contents and contents[-1]['role'] == role:
+            contents[-1]['parts'][0] += "\n\n" + text
+        else:
+            contents.append({'role': role, 'parts': [text]})
+
+    # History has to start with the user
+    while contents[0]['role'] != 'user':
+        contents.pop(0)
+    return contents
+
+def start_chat(user_message, chat_history=None, is_authenticated=False):
+    """Start a chat preloaded with history; returns the chat and the parts of the message to send"""
+    # Build the system prompt based on authentication status
+    system_prompt = CHAT_SYSTEM_PROMPT
+    if is_authenticated:
+        system_prompt += "The user is authenticated so you can provide detailed information."
+    else:
+        system_prompt += "The user needs to authenticate before accessing personalized services."
+    
+    model = get_model(system_instruction=system_prompt)
+    
+    # Earlier turns are preloaded as context rather than sent again
+    contents = build_chat_history(chat_history, user_message)
+    return model.start_chat(history=contents[:-1]), contents[-1]['parts']
+
 def get_chat_response(user_message, chat_history=None, is_authenticated=False):
-    """Get a conversational response from Gemini"""
+    """Get a conversational response from Gemini with one model call, or from the answer cache"""
+    partition = chat_partition(is_authenticated)
+    cached = lookup_answer(user_message, partition)
+    if cached is not None:
+        return cached
+
     try:
-        # Create a chat instance
-        model = genai.GenerativeModel("models/gemini-2.0-flash")
+        chat, parts = start_chat(user_message, chat_history, is_authenticated)
         
-        # Build the system prompt based on authentication status
-        system_prompt = """
-        You are FinEase Assistant, a helpful financial document processing assistant.
-        Your job is to help users with questions about GST, ITR, and EPF filing.
-        Be concise, knowledgeable and professional.
-        """
-        
-        if is_authenticated:
-            system_prompt += " The user is authenticated so you can provide detailed information."
-        else:
-            system_prompt += " The user needs to authenticate before accessing personalized services."
-        
-        # Initialize chat
-        chat = model.start_chat(history=[])
-        
-        # Add relevant chat history if provided
-        if chat_history:
-            for message in chat_history:
-                if message['role'] == 'user':
-                    chat.send_message(message['content'])
-                    
         # Send the current user message and get response
-        response = chat.send_message(f"{system_prompt}\n\nUser question: {user_message}")
+        with gemini.guard():
+            response = chat.send_message(parts)
+        store_answer(user_message, response.text, partition, chat_history)
         return response.text
     
+    except ProviderUnavailable as e:
+        logger.warning(f"Skipping Gemini chat: {e}")
+        return BUSY_MESSAGE
+
     except Exception as e:
         logger.error(f"Error getting chat response from Gemini: {e}")
         return "I'm having trouble connecting to my knowledge base right now. Please try again later."
 
+def stream_chat_response(user_message, chat_history=None, is_authenticated=False):
+    """Yield a conversational response from Gemini in pieces as it is generated; raises on failure"""
+    chat, parts = start_chat(user_message, chat_history, is_authenticated)
+    with gemini.guard():
+        for chunk in chat.send_message(parts, stream=True):
+            # Chunks without text parts (e.g. the final one) raise on .text
+            if chunk.parts and chunk.text:
+                yield chunk.text
+
 def validate_document(extracted_data, document_type):
     """Validate extracted document data using Gemini"""
     try:
@@ -115,9 +243,13 @@ def validate_document(extracted_data, document_type):
         Provide a validation summary with any issues found. If no issues, confirm the data appears valid.
         """
         
-        model = genai.GenerativeModel("models/gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        model = get_model()
+        with gemini.guard():
+            response = model.generate_content(prompt)
         return response.text
+    except ProviderUnavailable as e:
+        logger.warning(f"Skipping Gemini validation: {e}")
+        return "Validation skipped: the AI validator is busy right now."
     except Exception as e:
         logger.error(f"Error validating document with Gemini: {e}")
         return f"Error validating document: {str(e)}"
@@ -0,0 +1,133 @@
+"""
+Shared HTTP client for all outbound calls from the WhatsApp chatbot
+
+Every call to the backend, Nanonets, Twilio media and Gemini goes through
+one requests.Session, so connections are kept alive and pooled per host
+instead of paying a new TCP and TLS handshake on each request.
+"""
+import uuid
+import threading
+import requests
+from media_buffer import MEDIA_CHUNK_SIZE, open_media, media_size
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+    HTTP_POOL_SIZE
+)
+
+# Responses worth retrying for idempotent requests
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+def _build_session():
+    """Create a session with pooled, retrying adapters"""
+    # Connection errors are retried for every method since nothing was sent;
+    # read errors and retryable statuses only for idempotent methods
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        status=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """Get the shared HTTP session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def request(method, url, timeout=None, **kwargs):
+    """Send a request on the shared session with a default timeout"""
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT)
+    return get_session().request(method, url, timeout=timeout, **kwargs)
+
+def get(url, **kwargs):
+    """Send a GET request on the shared session"""
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    """Send a POST request on the shared session"""
+    return request('POST', url, **kwargs)
+
+def quote_header_value(value):
+    """Escape a value for a quoted multipart header parameter"""
+    return str(value).replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+class MultipartFile:
+    """
+    multipart/form-data body that streams one file.
+
+    The form fields and part headers are encoded up front, so the total
+    length is known and the request is sent with a Content-Length, while
+    the file itself (a path or a MediaBuffer) is read in MEDIA_CHUNK_SIZE
+    chunks as it is sent.
+    """
+
+    def __init__(self, fields, file_field, source, filename, content_type):
+        self.source = source
+        self.boundary = uuid.uuid4().hex
+
+        head = []
+        for name, value in fields.items():
+            if value is None:
+                continue
+            head.append(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'
+            )
+        head.append(
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{quote_header_value(filename)}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        )
+        self.head = ''.join(head).encode('utf-8')
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.length = len(self.head) + media_size(source) + len(self.tail)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        yield self.head
+        with open_media(self.source) as f:
+            while True:
+                chunk = f.read(MEDIA_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail
+
+def post_file(url, fields, file_field, source, filename, content_type, **kwargs):
+    """POST fields and a file path or MediaBuffer as multipart/form-data, streaming the file"""
+    body = MultipartFile(fields, file_field, source, filename, content_type)
+    headers = dict(kwargs.pop('headers', None) or {})
+    headers['Content-Type'] = body.content_type
+    return post(url, data=body, headers=headers, **kwargs)
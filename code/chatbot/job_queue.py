@@ -0,0 +1,48 @@
+"""
+Background job queue for the WhatsApp chatbot
+"""
+import queue
+import threading
+import traceback
+from config import JOB_WORKERS, JOB_QUEUE_SIZE
+
+# Jobs waiting for a worker thread
+_jobs = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+
+# Worker threads, started on first use
+_workers = []
+_workers_lock = threading.Lock()
+
+def _worker_loop():
+    """Run queued jobs one after another"""
+    while True:
+        func, args, kwargs = _jobs.get()
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in background job {getattr(func, '__name__', func)}: {e}")
+            traceback.print_exc()
+        finally:
+            _jobs.task_done()
+
+def start_workers(count=JOB_WORKERS):
+    """Start the worker pool if it isn't running yet"""
+    with _workers_lock:
+        while len(_workers) < count:
+            worker = threading.Thread(target=_worker_loop, name=f"job-worker-{len(_workers)}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+def enqueue_job(func, *args, **kwargs):
+    """Queue func(*args, **kwargs) for a worker; returns False if the queue is full"""
+    start_workers()
+    try:
+        _jobs.put_nowait((func, args, kwargs))
+        return True
+    except queue.Full:
+        print(f"Job queue full, rejecting {getattr(func, '__name__', func)}")
+        return False
+
+def pending_jobs():
+    """Number of jobs waiting for a worker"""
+    return _jobs.qsize()
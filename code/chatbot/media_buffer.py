@@ -0,0 +1,131 @@
+"""
+Spooled buffers for downloaded WhatsApp media
+
+An attachment is downloaded once into a MediaBuffer and the same bytes are
+then read by classification, extraction and the database save. Small files
+stay in memory; larger ones spill to a temporary file in the media folder.
+A task that may outlive the buffer's owner (e.g. a speculative extraction)
+retains it, and the memory or file is released once every holder closed it.
+"""
+import io
+import os
+import mimetypes
+import tempfile
+import threading
+from config import MEDIA_FOLDER, MEDIA_SPOOL_BYTES
+
+# Read and write size for media streams
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+class MediaClosedError(ValueError):
+    """A closed MediaBuffer was opened; a local bug, not a failure of whoever reads it"""
+
+class MediaBuffer:
+    """Write-once buffer of a media file that hands out independent readers"""
+
+    def __init__(self, filename, content_type=None, max_memory=MEDIA_SPOOL_BYTES):
+        self.filename = filename
+        self.content_type = content_type
+        self.max_memory = max_memory
+        self.size = 0
+        self.path = None
+        self._memory = bytearray()
+        self._data = None
+        self._file = None
+        self._closed = False
+        self._holders = 1
+        self._lock = threading.Lock()
+
+    def write(self, chunk):
+        """Append a chunk, moving the contents to disk once past max_memory"""
+        if self._file is None and self.size + len(chunk) > self.max_memory:
+            os.makedirs(MEDIA_FOLDER, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(dir=MEDIA_FOLDER, suffix=f"_{self.filename}")
+            self._file = os.fdopen(fd, 'wb')
+            self._file.write(self._memory)
+            self._memory = bytearray()
+
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._memory += chunk
+        self.size += len(chunk)
+
+    def finish(self):
+        """Mark the buffer complete; it is read-only from here on"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        else:
+            self._data = bytes(self._memory)
+            self._memory = bytearray()
+        return self
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def open(self):
+        """Open a new reader positioned at the start of the media"""
+        with self._lock:
+            if self._closed:
+                raise MediaClosedError(f"Media buffer {self.filename} is closed")
+            if self.path is not None:
+                return open(self.path, 'rb')
+            # BytesIO shares the bytes object until written to, so no copy is made
+            return io.BytesIO(self._data)
+
+    def retain(self):
+        """Add a holder; the buffer stays open until each holder has called close()"""
+        with self._lock:
+            if self._closed:
+                raise MediaClosedError(f"Media buffer {self.filename} is closed")
+            self._holders += 1
+        return self
+
+    def close(self):
+        """Drop a holder and, after the last one, release the memory or temporary file; readers already open keep working"""
+        with self._lock:
+            if self._closed:
+                return
+            self._holders -= 1
+            if self._holders > 0:
+                return
+            self._closed = True
+            self._data = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.path is not None:
+                try:
+                    os.remove(self.path)
+                except OSError as e:
+                    print(f"Error removing media spool file {self.path}: {e}")
+
+    def __repr__(self):
+        where = "memory" if self.in_memory else self.path
+        return f"MediaBuffer({self.filename!r}, {self.size} bytes, {where})"
+
+def open_media(source):
+    """Open a reader for a MediaBuffer or a file path"""
+    if isinstance(source, MediaBuffer):
+        return source.open()
+    return open(source, 'rb')
+
+def media_size(source):
+    """Size in bytes of a MediaBuffer or a file path"""
+    if isinstance(source, MediaBuffer):
+        return source.size
+    return os.path.getsize(source)
+
+def media_name(source):
+    """File name of a MediaBuffer or a file path"""
+    if isinstance(source, MediaBuffer):
+        return source.filename
+    return os.path.basename(source)
+
+def media_content_type(source):
+    """Content type of a MediaBuffer, or a guess from a file path's extension"""
+    if isinstance(source, MediaBuffer) and source.content_type:
+        return source.content_type
+    return mimetypes.guess_type(media_name(source))[0] or 'application/octet-stream'
@@ -0,0 +1,148 @@
+"""
+Outbound WhatsApp messaging for the chatbot
+
+All messages go through one Twilio client whose HTTP session keeps its
+connections alive. Messages for the same recipient are queued in an
+outbox and sent strictly in order by a single pool task at a time, while
+different recipients are served concurrently by a bounded thread pool.
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from config import (
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    TWILIO_WHATSAPP_NUMBER,
+    HTTP_TIMEOUT,
+    MESSAGE_SEND_WORKERS,
+    WHATSAPP_MESSAGE_LIMIT,
+    CHAT_STREAM_MIN_CHARS
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+# Pending messages per recipient, and recipients with a send task running
+_outboxes = {}
+_active_recipients = set()
+_outbox_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=MESSAGE_SEND_WORKERS, thread_name_prefix="whatsapp-send")
+
+def get_twilio_client():
+    """Get the shared Twilio client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Client(
+                    TWILIO_ACCOUNT_SID,
+                    TWILIO_AUTH_TOKEN,
+                    http_client=TwilioHttpClient(pool_connections=True, timeout=HTTP_TIMEOUT)
+                )
+    return _client
+
+def whatsapp_address(number):
+    """Add the "whatsapp:" prefix to a phone number if it is missing"""
+    if number.startswith('whatsapp:'):
+        return number
+    return f"whatsapp:{number}"
+
+def split_message(text, limit=WHATSAPP_MESSAGE_LIMIT):
+    """Split text into chunks that fit in one WhatsApp message"""
+    return [text[i:i+limit] for i in range(0, len(text), limit)] or [text]
+
+def stream_message_chunks(fragments, limit=WHATSAPP_MESSAGE_LIMIT, min_chars=CHAT_STREAM_MIN_CHARS):
+    """
+    Group streamed text fragments into WhatsApp-sized messages.
+
+    A message is yielded as soon as it holds complete paragraphs totalling
+    at least min_chars, or when the text reaches limit without a paragraph
+    break, in which case it is cut at the last line break or space.
+    """
+    buffer = ""
+    for fragment in fragments:
+        buffer += fragment
+
+        while True:
+            # Complete paragraphs end at the last blank line in the buffer
+            end = buffer.rfind("\n\n", 0, limit)
+            if end >= min_chars:
+                yield buffer[:end].strip()
+                buffer = buffer[end + 2:]
+                continue
+
+            if len(buffer) >= limit:
+                cut = max(buffer.rfind("\n", 0, limit), buffer.rfind(" ", 0, limit))
+                if cut <= 0:
+                    cut = limit
+                yield buffer[:cut].strip()
+                buffer = buffer[cut:].lstrip()
+                continue
+            break
+
+    if buffer.strip():
+        yield buffer.strip()
+
+def _create_message(to_address, body, media_url=None):
+    """Send one message with the shared client and return its SID"""
+    params = {
+        'from_': f"whatsapp:{TWILIO_WHATSAPP_NUMBER}",
+        'body': body,
+        'to': to_address
+    }
+
+    # Add media URL if provided
+    if media_url:
+        params['media_url'] = [media_url]
+
+    return get_twilio_client().messages.create(**params).sid
+
+def _drain_outbox(to_address):
+    """Send a recipient's queued messages in order until the outbox is empty"""
+    while True:
+        with _outbox_lock:
+            outbox = _outboxes.get(to_address)
+            if not outbox:
+                _outboxes.pop(to_address, None)
+                _active_recipients.discard(to_address)
+                return
+            body, media_url, future = outbox.popleft()
+
+        if not future.set_running_or_notify_cancel():
+            continue
+
+        try:
+            future.set_result(_create_message(to_address, body, media_url))
+        except Exception as e:
+            print(f"Error sending WhatsApp message to {to_address}: {e}")
+            future.set_exception(e)
+
+def queue_messages(to_number, bodies, media_url=None):
+    """
+    Queue messages for a recipient and return a Future per message.
+
+    Messages are sent in the order they were queued, after anything already
+    waiting for the same recipient. media_url is attached to each message.
+    """
+    to_address = whatsapp_address(to_number)
+    futures = []
+
+    with _outbox_lock:
+        outbox = _outboxes.setdefault(to_address, deque())
+        for body in bodies:
+            future = Future()
+            outbox.append((body, media_url, future))
+            futures.append(future)
+
+        if to_address not in _active_recipients:
+            _active_recipients.add(to_address)
+            _executor.submit(_drain_outbox, to_address)
+
+    return futures
+
+def queue_message(to_number, body, media_url=None):
+    """Queue a single message and return its Future"""
+    return queue_messages(to_number, [body], media_url)[0]
@@ -0,0 +1,214 @@
+"""
+Rate limiting, concurrency caps and circuit breaking for external providers
+
+Each provider (Gemini, Nanonets) gets a token-bucket rate limiter, a
+bulkhead capping concurrent calls and a circuit breaker. When the share
+of failed calls in the recent window crosses a threshold the breaker
+opens and calls fail fast with ProviderUnavailable, so workers return a
+degraded response instead of queueing behind a struggling provider.
+After a cool-down one trial call is let through; its outcome closes or
+re-opens the breaker. Clocks and sleep are injectable for testing;
+scripts/exercise_provider.py runs a provider against a local fake HTTP
+server.
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from media_buffer import MediaClosedError
+from config import (
+    PROVIDER_WAIT,
+    GEMINI_RATE,
+    GEMINI_BURST,
+    GEMINI_CONCURRENCY,
+    NANONETS_RATE,
+    NANONETS_BURST,
+    NANONETS_CONCURRENCY,
+    BREAKER_FAILURE_RATE,
+    BREAKER_MIN_CALLS,
+    BREAKER_WINDOW,
+    BREAKER_RESET
+)
+
+class ProviderUnavailable(Exception):
+    """A provider call was refused by its rate limiter, bulkhead or circuit breaker"""
+
+class RateLimiter:
+    """Token bucket allowing rate calls per second with bursts of up to burst calls"""
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=PROVIDER_WAIT):
+        """Take a token, sleeping until one is available; raises if that takes over max_wait seconds"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now and wait for it outside the lock
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0
+            if wait > max_wait:
+                raise ProviderUnavailable(f"rate limited for {wait:.1f}s")
+            self._tokens -= 1
+        if wait > 0:
+            self.sleep(wait)
+
+class Bulkhead:
+    """Caps the number of calls in progress at once"""
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self, max_wait=PROVIDER_WAIT):
+        """Take a call slot, waiting up to max_wait seconds for one"""
+        if not self._slots.acquire(timeout=max_wait):
+            raise ProviderUnavailable(f"all {self.max_concurrent} call slots busy")
+
+    def release(self):
+        self._slots.release()
+
+class CircuitBreaker:
+    """Opens when the failure rate over the last window seconds reaches failure_rate"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=BREAKER_FAILURE_RATE, min_calls=BREAKER_MIN_CALLS,
+                 window=BREAKER_WINDOW, reset_timeout=BREAKER_RESET, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (time, failed), oldest first
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise ProviderUnavailable unless a call may go ahead now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    raise ProviderUnavailable("circuit open")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    raise ProviderUnavailable("circuit half open, trial call in progress")
+                self._trial_running = True
+
+    def record(self, failed):
+        """Record the outcome of an allowed call"""
+        with self._lock:
+            now = self.clock()
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and self._outcomes[0][0] <= now - self.window:
+                self._failures -= self._outcomes.popleft()[1]
+
+            calls = len(self._outcomes)
+            if self.state == self.CLOSED and calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                self._open(now)
+
+    def cancel(self):
+        """Forget an allowed call that never reached the provider"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+class Provider:
+    """Rate limiter, bulkhead and circuit breaker guarding calls to one external service"""
+
+    def __init__(self, name, rate, burst, max_concurrent, breaker=None, local_errors=(MediaClosedError,),
+                 clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        # Exceptions raised by our own side of a call, which say nothing about the provider
+        self.local_errors = local_errors
+        self.limiter = RateLimiter(rate, burst, clock=clock, sleep=sleep)
+        self.bulkhead = Bulkhead(max_concurrent)
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+
+    @contextmanager
+    def guard(self, max_wait=PROVIDER_WAIT):
+        """Run the block as one provider call; exceptions raised in it, other than local_errors, count as failures"""
+        try:
+            self.breaker.allow()
+        except ProviderUnavailable as e:
+            raise ProviderUnavailable(f"{self.name} unavailable: {e}") from None
+
+        outcome = Outcome()
+        try:
+            self.limiter.acquire(max_wait)
+            self.bulkhead.acquire(max_wait)
+        except ProviderUnavailable as e:
+            # Refused before reaching the provider; says nothing about its health
+            self.breaker.cancel()
+            raise ProviderUnavailable(f"{self.name} unavailable: {e}") from None
+
+        try:
+            yield outcome
+        except Exception as e:
+            if isinstance(e, self.local_errors):
+                self.breaker.cancel()
+            else:
+                self.breaker.record(True)
+            raise
+        except BaseException:
+            # Abandoned (e.g. a stream closed early) rather than failed
+            self.breaker.cancel()
+            raise
+        else:
+            self.breaker.record(outcome.failed)
+        finally:
+            self.bulkhead.release()
+
+    def call(self, func, *args, is_failure=None, **kwargs):
+        """Call func through guard; is_failure(result) marks results such as 5xx responses as failures"""
+        with self.guard() as outcome:
+            result = func(*args, **kwargs)
+            if is_failure is not None and is_failure(result):
+                outcome.fail()
+            return result
+
+class Outcome:
+    """Lets a guarded block mark its call failed without raising"""
+
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+def server_error(response):
+    """Whether an HTTP response means the provider is struggling (rate limited or 5xx)"""
+    return response.status_code == 429 or response.status_code >= 500
+
+# Providers shared by every worker in this process
+gemini = Provider('Gemini', GEMINI_RATE, GEMINI_BURST, GEMINI_CONCURRENCY)
+nanonets = Provider('Nanonets', NANONETS_RATE, NANONETS_BURST, NANONETS_CONCURRENCY)
@@ -0,0 +1,59 @@
+"""
+Memory benchmark for session records.
+
+Builds many logged-in sessions, without and with a few chat messages, as
+the nested dicts sessions used to be and as Session records, and reports
+the memory each layout takes.
+
+Usage: python3 scripts/bench_session_memory.py [sessions]
+"""
+import os
+import sys
+import gc
+import tracemalloc
+
+# The chatbot modules live one level above this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from session_record import Session
+
+CHAT = [('user', 'How do I file GST?'), ('assistant', 'Upload your invoice from the menu.')] * 2
+
+def dict_sessions(count, messages):
+    sessions = {}
+    for i in range(count):
+        sessions[f"whatsapp:+91{i:010d}"] = {
+            'state': 'awaiting_option',
+            'selected_option': 'gst_filing',
+            'auth': {'is_authenticated': True, 'user_id': f"user{i}", 'token': f"token{i}", 'email': f"user{i}@example.com"},
+            'chat_history': [{'role': role, 'content': content} for role, content in messages]
+        }
+    return sessions
+
+def record_sessions(count, messages):
+    sessions = {}
+    for i in range(count):
+        session = Session()
+        session.set_state('awaiting_option')
+        session.set_selected_option('gst_filing')
+        session.login(f"user{i}", f"token{i}", f"user{i}@example.com")
+        for role, content in messages:
+            session.add_message(role, content)
+        sessions[f"whatsapp:+91{i:010d}"] = session
+    return sessions
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 100_000
+
+    for messages in ([], CHAT):
+        print(f"{count} sessions, {len(messages)} chat messages each")
+        for name, build in (("nested dicts", dict_sessions), ("Session records", record_sessions)):
+            gc.collect()
+            tracemalloc.start()
+            sessions = build(count, messages)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {name:16} {size / 1024 / 1024:8.1f} MB  ({size / count:6.0f} bytes/session)")
+            del sessions
+
+if __name__ == "__main__":
+    main(sys.argv)
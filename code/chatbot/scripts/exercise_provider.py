@@ -0,0 +1,71 @@
+"""
+Exercise a guarded provider against a local fake HTTP server.
+
+Sends bursts of calls through a Provider while the fake server is
+healthy, returns 503, stalls, and recovers, and prints how many calls
+succeeded, failed or were refused and the circuit breaker's state after
+each phase.
+
+Usage: python3 scripts/exercise_provider.py
+"""
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+# The chatbot modules live one level above this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from resilience import Provider, CircuitBreaker, ProviderUnavailable, server_error
+
+# What the fake provider does with each request
+behaviour = {'status': 200, 'delay': 0.0}
+
+class FakeProvider(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(behaviour['delay'])
+        self.send_response(behaviour['status'])
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProvider)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    provider = Provider('fake', rate=50, burst=10, max_concurrent=4,
+                        breaker=CircuitBreaker(failure_rate=0.5, min_calls=10, window=10, reset_timeout=1))
+
+    def attempt(_):
+        try:
+            return provider.call(requests.get, url, timeout=2, is_failure=server_error).status_code
+        except ProviderUnavailable:
+            return 'rejected'
+        except requests.RequestException:
+            return 'error'
+
+    def run(label, calls, workers=8):
+        started = time.monotonic()
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(attempt, range(calls)))
+        summary = {result: results.count(result) for result in set(results)}
+        print(f"{label:32} {summary}  {time.monotonic() - started:5.2f}s  breaker {provider.breaker.state}")
+
+    run("healthy", 40)
+    behaviour.update(status=503)
+    run("provider returning 503", 80)
+    behaviour.update(status=200, delay=1.0)
+    run("open breaker, slow provider", 40)
+    time.sleep(1.1)
+    behaviour.update(delay=0.0)
+    run("after cool-down, recovered", 40)
+    run("closed again", 40)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Stress test for concurrent session updates.
+
+Runs load-change-save cycles on the memory and SQLite session stores from
+many threads and, for SQLite, from several forked processes sharing one
+store like gunicorn workers. Every update must survive; a lost update shows
+up as a missing chat message or a low count.
+
+Usage: python3 scripts/stress_sessions.py
+"""
+import os
+import sys
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# The chatbot modules live one level above this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import session_manager
+from session_store import MemorySessionStore, SqliteSessionStore
+
+USERS = 20
+THREADS = 40
+MESSAGES = 10  # per user; the chat history keeps exactly this many
+INCREMENTS = 200
+
+def increment(user_id):
+    """Read-modify-write that loses counts unless it is atomic"""
+    with session_manager.session_transaction(user_id):
+        session = session_manager.load_session(user_id)
+        # The token field doubles as a counter; stores keep it only for logged-in sessions
+        session.login(user_id, str(int(session.token or 0) + 1), None)
+        session_manager.save_session(user_id, session)
+
+def hammer(worker, workers, increments):
+    """Add this worker's share of every user's messages and run its increments"""
+    for i in range(worker, MESSAGES, workers):
+        for user in range(USERS):
+            session_manager.add_to_chat_history(f"user{user}", 'user', f"message {i}")
+            session_manager.update_session(f"user{user}", state='awaiting_option')
+    for i in range(increments):
+        increment(f"user{i % USERS}")
+
+def run_threads(increments, process=0, processes=1):
+    workers = processes * THREADS
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(lambda thread: hammer(process * THREADS + thread, workers, increments), range(THREADS)))
+
+def check(name, expected_count):
+    lost_messages = sum(MESSAGES - len(session_manager.get_chat_history(f"user{user}")) for user in range(USERS))
+    count = sum(int(session_manager.get_auth_token(f"user{user}") or 0) for user in range(USERS))
+    result = "ok" if not lost_messages and count == expected_count else "LOST UPDATES"
+    print(f"{name:34} {lost_messages} messages lost, {count}/{expected_count} increments  {result}")
+
+def main():
+    session_manager.session_store = MemorySessionStore()
+    run_threads(INCREMENTS)
+    check("memory, threads", THREADS * INCREMENTS)
+
+    with tempfile.TemporaryDirectory() as folder:
+        session_manager.session_store = SqliteSessionStore(os.path.join(folder, 'sessions.sqlite3'))
+        run_threads(INCREMENTS // 4)
+        check("sqlite, threads", THREADS * (INCREMENTS // 4))
+
+        # Created before forking, like the store session_manager creates at
+        # import in a preforked gunicorn; each worker opens its own connection
+        session_manager.session_store = SqliteSessionStore(os.path.join(folder, 'shared.sqlite3'))
+        processes = 4
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=run_threads, args=(INCREMENTS // 10, process, processes))
+            for process in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        check(f"sqlite, {processes} processes x {THREADS} threads", processes * THREADS * (INCREMENTS // 10))
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,147 @@
 """
 User session management for WhatsApp chatbot
-"""
 
-# Global storage for user sessions
-user_sessions = {}
+Every load-change-save of a session runs under session_transaction(): a
+striped lock for threads in this process plus the store's transaction, so
+with the SQLite store gunicorn workers can't overwrite each other's
+updates. Functions that only read a session skip the transaction and
+never create one. The per-user webhook lock only orders a user's messages
+within one process. scripts/stress_sessions.py stress tests concurrent
+updates on both stores.
+"""
+import threading
+from contextlib import contextmanager
+from config import SESSION_LOCK_STRIPES
+from session_store import create_session_store
+from session_record import Session, SessionState
+
+# Storage for user sessions; every function loads, changes and saves through it
+session_store = create_session_store()
+
+# Striped locks guarding each load-change-save, so concurrent updates for one
+# user can't overwrite each other while different users rarely contend
+_session_locks = [threading.RLock() for _ in range(SESSION_LOCK_STRIPES)]
+
+# Per-user locks held while a webhook request is handled, with their holder counts
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+
+def session_lock(user_id):
+    """Get the lock stripe guarding a user's session"""
+    return _session_locks[hash(user_id) % len(_session_locks)]
+
+@contextmanager
+def session_transaction(user_id):
+    """Hold a user's lock stripe and a store transaction around a load-change-save"""
+    with session_lock(user_id), session_store.transaction():
+        yield
+
+@contextmanager
+def user_lock(user_id):
+    """Hold a user's lock so their messages are handled one at a time in this process"""
+    with _user_locks_guard:
+        entry = _user_locks.get(user_id)
+        if entry is None:
+            entry = _user_locks[user_id] = [threading.Lock(), 0]
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _user_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _user_locks[user_id]
+
+def load_session(user_id):
+    """Load a user's session from the store, creating a new one if needed"""
+    with session_transaction(user_id):
+        session = session_store.get(user_id)
+        if session is None:
+            session = Session()
+            session_store.set(user_id, session)
+        return session
+
+def read_session(user_id):
+    """Read a user's session without a store transaction; an unsaved new Session if they have none"""
+    session = session_store.get(user_id)
+    return Session() if session is None else session
+
+def save_session(user_id, session):
+    """Save a user's session back to the store"""
+    session_store.set(user_id, session)
+    return session
 
 def init_session(user_id):
     """Initialize a new user session if it doesn't exist"""
-    if user_id not in user_sessions:
-        user_sessions[user_id] = {
-            'state': 'initial',
-            'selected_option': None,
-            'auth': {
-                'is_authenticated': False,
-                'user_id': None,
-                'token': None,
-                'email': None
-            },
-            'chat_history': []  # Add chat history tracking for Gemini
-        }
-    return user_sessions[user_id]
+    return load_session(user_id)
 
 def get_session(user_id):
     """Get a user's session data"""
-    # Create if it doesn't exist
-    return init_session(user_id)
+    return read_session(user_id)
 
 def update_session(user_id, state=None, selected_option=None):
     """Update a user's session data"""
-    session = init_session(user_id)
+    with session_transaction(user_id):
+        session = load_session(user_id)
     
-    if state is not None:
-        session['state'] = state
+        if state is not None:
+            session.set_state(state)
     
-    if selected_option is not None:
-        session['selected_option'] = selected_option
+        if selected_option is not None:
+            session.set_selected_option(selected_option)
     
-    return session
+        return save_session(user_id, session)
 
 def reset_session(user_id):
     """Reset a user's session to initial state but preserve auth data"""
-    auth_data = user_sessions.get(user_id, {}).get('auth', {})
-    chat_history = user_sessions.get(user_id, {}).get('chat_history', [])
+    with session_transaction(user_id):
+        session = load_session(user_id)
     
-    user_sessions[user_id] = {
-        'state': 'initial',
-        'selected_option': None,
-        'auth': auth_data,
-        'chat_history': chat_history  # Preserve chat history when resetting session
-    }
-    return user_sessions[user_id]
+        # Auth data and chat history are preserved when resetting session
+        session.state = SessionState.INITIAL
+        session.selected_option = None
+        return save_session(user_id, session)
 
 def get_user_state(user_id):
     """Get the current state for a user"""
     session = get_session(user_id)
-    return session['state']
+    return session.state
 
 def get_selected_option(user_id):
     """Get the selected option for a user"""
     session = get_session(user_id)
-    return session['selected_option']
+    return session.selected_option
 
 def set_authenticated(user_id, user_data):
     """Set a user as authenticated with their user data"""
-    session = get_session(user_id)
-    session['auth'] = {
-        'is_authenticated': True,
-        'user_id': user_data.get('id'),
-        'token': user_data.get('token'),
-        'email': user_data.get('email')
-    }
-    return session
+    with session_transaction(user_id):
+        session = load_session(user_id)
+        session.login(user_data.get('id'), user_data.get('token'), user_data.get('email'))
+        return save_session(user_id, session)
 
 def is_authenticated(user_id):
     """Check if a user is authenticated"""
     session = get_session(user_id)
-    return session['auth'].get('is_authenticated', False)
+    return session.is_authenticated
 
 def get_user_id(user_id):
     """Get the database user ID for a WhatsApp user"""
     session = get_session(user_id)
-    return session['auth'].get('user_id')
+    return session.user_id
 
 def get_auth_token(user_id):
     """Get the authentication token for a user"""
     session = get_session(user_id)
-    return session['auth'].get('token')
+    return session.token
 
 def logout(user_id):
     """Clear authentication for a user"""
-    session = get_session(user_id)
-    session['auth'] = {
-        'is_authenticated': False,
-        'user_id': None,
-        'token': None,
-        'email': None
-    }
-    return session
+    with session_transaction(user_id):
+        session = load_session(user_id)
+        session.logout()
+        return save_session(user_id, session)
 
 def check_auth_required(user_id):
     """Check if user is authenticated and return appropriate message if not"""
@@ -112,41 +157,30 @@ def check_auth_required(user_id):
 def get_user_email(user_id):
     """Get the email of the authenticated user"""
     session = get_session(user_id)
-    return session['auth'].get('email')
+    return session.email
 
 # New functions for chat history management
 def add_to_chat_history(user_id, role, content):
     """Add a message to the user's chat history"""
-    session = get_session(user_id)
-    
-    # Initialize chat_history if not present (for backward compatibility)
-    if 'chat_history' not in session:
-        session['chat_history'] = []
-    
-    # Add the message to chat history
-    session['chat_history'].append({
-        'role': role,  # 'user' or 'assistant'
-        'content': content
-    })
+    with session_transaction(user_id):
+        session = load_session(user_id)
     
-    # Keep only the last 10 messages to prevent unlimited growth
-    if len(session['chat_history']) > 10:
-        session['chat_history'] = session['chat_history'][-10:]
+        # Role is 'user' or 'assistant'; the history keeps only the last
+        # 10 messages to prevent unlimited growth
+        session.add_message(role, content)
     
-    return session
+        return save_session(user_id, session)
 
 def get_chat_history(user_id):
     """Get the current chat history for a user"""
-    session = get_session(user_id)
-    
-    # Initialize chat_history if not present (for backward compatibility)
-    if 'chat_history' not in session:
-        session['chat_history'] = []
-    
-    return session['chat_history']
+    # The memory store hands out the live session, so copy its history
+    # while no update for this user can append to it
+    with session_lock(user_id):
+        return read_session(user_id).history()
 
 def clear_chat_history(user_id):
     """Clear the chat history for a user"""
-    session = get_session(user_id)
-    session['chat_history'] = []
-    return session
\ No newline at end of file
+    with session_transaction(user_id):
+        session = load_session(user_id)
+        session.clear_history()
+        return save_session(user_id, session)
@@ -0,0 +1,148 @@
+"""
+Compact per-user session record for the WhatsApp chatbot
+
+Sessions use __slots__ and hold states and options as shared enum members
+rather than per-session strings. Chat history is a fixed-size ring buffer
+of (role, content) tuples, allocated once the user starts chatting.
+scripts/bench_session_memory.py compares memory use against the nested
+dict layout it replaces.
+"""
+import sys
+from enum import Enum
+from collections import deque
+
+# Messages of chat history kept per user
+CHAT_HISTORY_LENGTH = 10
+
+class StrEnum(str, Enum):
+    """Enum whose members hash, print and format exactly like their string values"""
+    __hash__ = str.__hash__
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+class SessionState(StrEnum):
+    """Where a user is in the conversation"""
+    INITIAL = 'initial'
+    AWAITING_AUTH = 'awaiting_auth'
+    AWAITING_OPTION = 'awaiting_option'
+    AWAITING_DOCUMENT = 'awaiting_document'
+    CHATTING_WITH_GEMINI = 'chatting_with_gemini'
+
+class MenuOption(StrEnum):
+    """Menu option a user selected"""
+    GST_FILING = 'gst_filing'
+    ITR_FILING = 'itr_filing'
+    PF_FILING = 'pf_filing'
+    CLASSIFY = 'classify'
+    AUTHENTICATE = 'authenticate'
+    ASK_GEMINI = 'ask_gemini'
+    LOGOUT = 'logout'
+
+def to_enum(enum_class, value):
+    """Return the enum member for value, or value itself if it isn't one"""
+    if value is None or isinstance(value, enum_class):
+        return value
+    try:
+        return enum_class(value)
+    except ValueError:
+        return value
+
+class Session:
+    """State, login and recent chat history of one WhatsApp user"""
+
+    __slots__ = ('state', 'selected_option', 'is_authenticated', 'user_id', 'token', 'email', 'chat_history')
+
+    def __init__(self):
+        self.state = SessionState.INITIAL
+        self.selected_option = None
+        self.is_authenticated = False
+        self.user_id = None
+        self.token = None
+        self.email = None
+        self.chat_history = None
+
+    def set_state(self, state):
+        self.state = to_enum(SessionState, state)
+
+    def set_selected_option(self, option):
+        self.selected_option = to_enum(MenuOption, option)
+
+    def login(self, user_id, token, email):
+        self.is_authenticated = True
+        self.user_id = user_id
+        self.token = token
+        self.email = email
+
+    def logout(self):
+        self.is_authenticated = False
+        self.user_id = None
+        self.token = None
+        self.email = None
+
+    def add_message(self, role, content):
+        """Append to the chat history, dropping the oldest message when full"""
+        if self.chat_history is None:
+            self.chat_history = deque(maxlen=CHAT_HISTORY_LENGTH)
+        self.chat_history.append((sys.intern(role), content))
+
+    def clear_history(self):
+        self.chat_history = None
+
+    def history(self):
+        """Chat history as a list of {'role', 'content'} dicts, oldest first"""
+        if self.chat_history is None:
+            return []
+        return [{'role': role, 'content': content} for role, content in self.chat_history]
+
+    def auth(self):
+        """Auth data in the shape session_manager has always returned"""
+        return {
+            'is_authenticated': self.is_authenticated,
+            'user_id': self.user_id,
+            'token': self.token,
+            'email': self.email
+        }
+
+    def to_dict(self):
+        """Plain dict for persistent stores"""
+        return {
+            'state': self.state.value if isinstance(self.state, Enum) else self.state,
+            'selected_option': self.selected_option.value if isinstance(self.selected_option, Enum) else self.selected_option,
+            'auth': self.auth(),
+            'chat_history': self.history()
+        }
+
+    # Keys callers of the old session dicts read, e.g. session['state']
+    DICT_KEYS = ('state', 'selected_option', 'auth', 'chat_history')
+
+    def __getitem__(self, key):
+        """Read a session like the dict to_dict returns"""
+        if key == 'auth':
+            return self.auth()
+        if key == 'chat_history':
+            return self.history()
+        if key in self.DICT_KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.DICT_KEYS
+
+    def get(self, key, default=None):
+        return self[key] if key in self.DICT_KEYS else default
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a session saved with to_dict"""
+        session = cls()
+        session.set_state(data.get('state', SessionState.INITIAL))
+        session.set_selected_option(data.get('selected_option'))
+        auth = data.get('auth') or {}
+        if auth.get('is_authenticated'):
+            session.login(auth.get('user_id'), auth.get('token'), auth.get('email'))
+        for message in data.get('chat_history', []):
+            session.add_message(message['role'], message['content'])
+        return session
+
+    def __repr__(self):
+        return f"Session(state={self.state!r}, selected_option={self.selected_option!r}, authenticated={self.is_authenticated})"
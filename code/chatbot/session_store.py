@@ -0,0 +1,216 @@
+"""
+Storage backends for WhatsApp chatbot sessions
+
+session_manager loads a user's session from the configured store, changes
+it and saves it back. The in-memory store keeps a bounded number of
+sessions in this process; the SQLite store persists them across restarts
+and shares them between workers on the same host. Load-change-save runs
+inside transaction(), which for SQLite is a BEGIN IMMEDIATE transaction so
+two worker processes can't overwrite each other's updates; reads outside a
+transaction are plain SELECTs on a per-thread connection and wait for no
+one. Each process opens its own SQLite connections on first use, so a
+store created before gunicorn forks its workers is safe to use in them. Sessions are Session
+records; the SQLite store saves them as JSON.
+"""
+import os
+import time
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from session_record import Session
+from config import SESSION_STORE, SESSION_DB_PATH, SESSION_TTL, SESSION_MAX
+
+class SessionStore:
+    """Interface for session storage; sessions are Session records keyed by WhatsApp number"""
+
+    def get(self, key):
+        """Return the session for key, or None if there is none or it expired"""
+        raise NotImplementedError
+
+    def set(self, key, session):
+        """Save the session for key"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove the session for key"""
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        """Make the gets and sets in the block atomic against other processes sharing the store"""
+        yield
+
+    def __len__(self):
+        raise NotImplementedError
+
+class MemorySessionStore(SessionStore):
+    """Sessions in this process, evicted when idle for ttl seconds or beyond max_sessions"""
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = OrderedDict()  # key -> (expires_at, session), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            if expires_at <= self.clock():
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return session
+
+    def set(self, key, session):
+        with self._lock:
+            self._sessions[key] = (self.clock() + self.ttl, session)
+            self._sessions.move_to_end(key)
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def _evict(self):
+        """Drop expired sessions from the old end, then the least recently used over the limit"""
+        now = self.clock()
+        while self._sessions:
+            key, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[key]
+
+    def __len__(self):
+        return len(self._sessions)
+
+class SqliteSessionStore(SessionStore):
+    """Sessions stored as JSON in a SQLite database, expiring after ttl seconds idle"""
+
+    # Expired rows are purged after this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._writes = 0
+        # Held for a whole transaction, so it must allow the gets and sets inside it
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        self._transaction_thread = None
+        # Per-thread connections for reads outside a transaction
+        self._readers = threading.local()
+        # Opened on first use by the process using it; a connection must not
+        # be shared with workers forked after the store was created
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        """Return this process's connection, opening it if needed; call with _lock held"""
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Autocommit; transaction() opens explicit transactions
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            self._connection = connection
+            self._pid = os.getpid()
+            self._transaction_depth = 0
+            self._transaction_thread = None
+        return self._connection
+
+    def _reader(self):
+        """Return this thread's read connection, opening it if needed"""
+        pid, connection = getattr(self._readers, 'connection', (None, None))
+        if pid != os.getpid():
+            with self._lock:
+                # Creates the database and table if no one has yet
+                self._connect()
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._readers.connection = (os.getpid(), connection)
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._transaction_depth:
+                # Nested in a transaction this thread already holds
+                self._transaction_depth += 1
+                try:
+                    yield
+                finally:
+                    self._transaction_depth -= 1
+                return
+
+            # Take the write lock up front so another process can't read the
+            # same session and save over this update
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            self._transaction_depth = 1
+            self._transaction_thread = threading.get_ident()
+            try:
+                yield
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+            finally:
+                self._transaction_depth = 0
+                self._transaction_thread = None
+
+    def get(self, key):
+        query = "SELECT data FROM sessions WHERE key = ? AND expires_at > ?"
+        if self._transaction_thread == threading.get_ident():
+            # Inside this thread's transaction, read what it has written so far
+            with self._lock:
+                row = self._connect().execute(query, (key, self.clock())).fetchone()
+        else:
+            row = self._reader().execute(query, (key, self.clock())).fetchone()
+        if row is None:
+            return None
+        return Session.from_dict(json.loads(row[0]))
+
+    def set(self, key, session):
+        data = json.dumps(session.to_dict())
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (key, data, expires_at) VALUES (?, ?, ?)",
+                (key, data, self.clock() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (self.clock(),))
+
+    def delete(self, key):
+        with self._lock:
+            self._connect().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM sessions WHERE expires_at > ?",
+                (self.clock(),)
+            ).fetchone()[0]
+
+def create_session_store(kind=SESSION_STORE):
+    """Create the session store selected by SESSION_STORE ('memory' or 'sqlite')"""
+    if kind == 'sqlite':
+        return SqliteSessionStore()
+    if kind != 'memory':
+        print(f"Unknown SESSION_STORE '{kind}', using memory")
+    return MemorySessionStore()
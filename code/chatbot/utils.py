@@ -1,7 +1,11 @@
 import os
-import requests
+import json
 import base64
-from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER, BACKEND_URL
+import http_client
+from resilience import gemini, server_error, ProviderUnavailable
+from answer_cache import lookup_answer, store_answer
+from media_buffer import MediaBuffer, MEDIA_CHUNK_SIZE, open_media, media_size
+from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, BACKEND_URL, STREAMING_UPLOAD
 
 def get_file_extension(content_type):
     """Get file extension based on content type"""
@@ -14,39 +18,85 @@ def get_file_extension(content_type):
     
     return extensions.get(content_type, 'bin')
 
-def download_media(media_url, file_path):
-    """Download media from Twilio with authentication"""
+def download_media_buffer(media_url, filename, content_type=None):
+    """Download media from Twilio into a MediaBuffer; returns None on failure"""
+    buffer = MediaBuffer(filename, content_type)
     try:
         # Use authentication for Twilio media
-        response = requests.get(
+        with http_client.get(
             media_url, 
             auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), 
             stream=True
-        )
-        response.raise_for_status()  # Raises an error for bad responses
+        ) as response:
+            response.raise_for_status()  # Raises an error for bad responses
+            
+            for chunk in response.iter_content(MEDIA_CHUNK_SIZE):
+                buffer.write(chunk)
         
-        # Make sure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        buffer.finish()
+        print(f"Downloaded media: {buffer}")
+        return buffer
+    except Exception as e:
+        print(f"Error downloading media: {e}")
+        buffer.close()
+        return None
+
+def save_to_database(file_path, user_id, original_name, mime_type, document_type, classification, extracted_data, whatsapp_number):
+    """Save a file path or MediaBuffer to the database instead of local storage"""
+    if STREAMING_UPLOAD:
+        saved = upload_to_database(file_path, user_id, original_name, mime_type, document_type, classification, extracted_data, whatsapp_number)
+        if saved is not None:
+            return saved
+    
+    return save_to_database_json(file_path, user_id, original_name, mime_type, document_type, classification, extracted_data, whatsapp_number)
+
+def upload_to_database(file_path, user_id, original_name, mime_type, document_type, classification, extracted_data, whatsapp_number):
+    """Stream the file to the backend as multipart/form-data; returns None if the backend has no upload endpoint"""
+    try:
+        fields = {
+            'userId': user_id,
+            'originalName': original_name,
+            'mimeType': mime_type,
+            'documentType': document_type,
+            'classification': classification,
+            'extractedData': json.dumps(extracted_data),
+            'whatsappNumber': whatsapp_number
+        }
         
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
+        response = http_client.post_file(
+            f"{BACKEND_URL}/api/files/upload",
+            fields,
+            'file',
+            file_path,
+            original_name,
+            mime_type
+        )
         
-        print(f"Downloaded file: {file_path}")
-        return True
+        if response.status_code == 201:
+            print(f"File uploaded to database successfully: {response.json().get('fileId')}")
+            # Buffers are released by their owner; local files are removed once saved
+            if not isinstance(file_path, MediaBuffer):
+                os.remove(file_path)
+            return True
+        elif response.status_code == 404 and 'User not found' not in response.text:
+            # Backend without the upload route
+            return None
+        else:
+            print(f"Error uploading file to database: {response.status_code}, {response.text}")
+            return False
     except Exception as e:
-        print(f"Error downloading media: {e}")
+        print(f"Error uploading file to database: {e}")
         return False
 
-def save_to_database(file_path, user_id, original_name, mime_type, document_type, classification, extracted_data, whatsapp_number):
-    """Save file to database instead of local storage"""
+def save_to_database_json(file_path, user_id, original_name, mime_type, document_type, classification, extracted_data, whatsapp_number):
+    """Save file to database as base64 in a JSON payload"""
     try:
         # Read file data and convert to base64
-        with open(file_path, 'rb') as f:
+        with open_media(file_path) as f:
             file_data = base64.b64encode(f.read()).decode('utf-8')
         
         # Get file size
-        file_size = os.path.getsize(file_path)
+        file_size = media_size(file_path)
         
         # Prepare data for API request
         payload = {
@@ -62,7 +112,7 @@ def save_to_database(file_path, user_id, original_name, mime_type, document_type
         }
         
         # Send request to backend API
-        response = requests.post(
+        response = http_client.post(
             f"{BACKEND_URL}/api/files/save",
             json=payload
         )
@@ -70,7 +120,8 @@ def save_to_database(file_path, user_id, original_name, mime_type, document_type
         if response.status_code == 201:
             print(f"File saved to database successfully: {response.json().get('fileId')}")
             # Optionally, delete the local file after saving to database
-            os.remove(file_path)
+            if not isinstance(file_path, MediaBuffer):
+                os.remove(file_path)
             return True
         else:
             print(f"Error saving file to database: {response.status_code}, {response.text}")
@@ -88,7 +139,7 @@ def authenticate_user(email, password, whatsapp_number):
             'whatsappNumber': whatsapp_number
         }
         
-        response = requests.post(
+        response = http_client.post(
             f"{BACKEND_URL}/api/files/authenticate-whatsapp",
             json=payload
         )
@@ -102,32 +153,6 @@ def authenticate_user(email, password, whatsapp_number):
         print(f"Authentication error: {e}")
         return None
 
-def send_whatsapp_message(to_number, message_body, media_url=None):
-    """Send a WhatsApp message with optional media attachment"""
-    # This function requires Twilio client from the calling code
-    from twilio.rest import Client
-    
-    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    
-    # Clean the phone number - remove "whatsapp:" prefix if present
-    if to_number.startswith('whatsapp:'):
-        clean_number = to_number
-    else:
-        clean_number = f"whatsapp:{to_number}"
-    
-    params = {
-        'from_': f"whatsapp:{TWILIO_WHATSAPP_NUMBER}",
-        'body': message_body,
-        'to': clean_number
-    }
-    
-    # Add media URL if provided
-    if media_url:
-        params['media_url'] = [media_url]
-    
-    message = client.messages.create(**params)
-    return message.sid
-
 def format_menu():
     """Create a well-formatted menu with emojis and numbers"""
     from config import MENU_OPTIONS
@@ -208,7 +233,7 @@ def save_extracted_data_to_specific_table(extracted_data, document_type, email):
             }
         
         # Send request to the specific API endpoint
-        response = requests.post(
+        response = http_client.post(
             endpoint,
             json=extracted_data
         )
@@ -236,22 +261,28 @@ def save_extracted_data_to_specific_table(extracted_data, document_type, email):
 
 def ask_gemini_llm(question):
     """Send a question to Google Gemini LLM and return the answer text"""
-    import requests
-    import os
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
         return "Gemini API key not set."
+    cached = lookup_answer(question, 'llm')
+    if cached is not None:
+        return cached
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
     headers = {"Content-Type": "application/json"}
     data = {
         "contents": [{"parts": [{"text": question}]}]
     }
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=15)
+        response = gemini.call(http_client.post, url, headers=headers, json=data, timeout=15, is_failure=server_error)
         if response.status_code == 200:
             result = response.json()
-            return result['candidates'][0]['content']['parts'][0]['text']
+            answer = result['candidates'][0]['content']['parts'][0]['text']
+            store_answer(question, answer, 'llm')
+            return answer
         else:
             return f"Gemini API error: {response.status_code} {response.text}"
+    except ProviderUnavailable as e:
+        print(f"Skipping Gemini call: {e}")
+        return "Gemini is busy right now. Please try again in a minute."
     except Exception as e:
         return f"Gemini API error: {str(e)}"